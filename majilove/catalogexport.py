@@ -0,0 +1,186 @@
+import datetime, hashlib, json, os, tempfile, time
+from collections import OrderedDict
+from django.conf import settings as django_settings
+from django.db import models as django_models
+from django.utils import translation
+from majilove import models
+
+# Change it when the format of the shards changes, so they're all generated again
+EXPORT_VERSION = 1
+
+MANIFEST = 'manifest.json'
+
+HASH_LENGTH = 12
+
+############################################################
+# Items
+
+def _translatedFields(model):
+    """
+    Fields that have translations in a d_ field, like name and d_names.
+    """
+    names = set(field.name for field in model._meta.fields)
+    return set(name for name in names if u'd_{}s'.format(name) in names)
+
+def itemToDict(item):
+    """
+    All the fields of item in the active language, except its owner and caches.
+    Choices are exported with their name and their translation.
+    """
+    translated = _translatedFields(type(item))
+    d = OrderedDict()
+    for field in item._meta.fields:
+        name = field.name
+        if name == 'owner' or name.startswith('_') or name.startswith('d_'):
+            continue
+        if name.startswith('i_'):
+            d[name[2:]] = getattr(item, name[2:])
+            d[u't_{}'.format(name[2:])] = unicode(getattr(item, u't_{}'.format(name[2:]))) if getattr(item, name) is not None else None
+            continue
+        if isinstance(field, django_models.ForeignKey):
+            d[name] = getattr(item, field.attname)
+            continue
+        value = getattr(item, name)
+        if isinstance(field, django_models.FileField):
+            value = getattr(item, u'{}_url'.format(name)) if value else None
+        elif isinstance(value, (datetime.date, datetime.datetime)):
+            value = value.isoformat()
+        d[name] = value
+        if name in translated:
+            d[u't_{}'.format(name)] = getattr(item, u't_{}'.format(name))
+    return d
+
+def photoSkills(photo, language):
+    return OrderedDict([
+        (name, photo.get_rendered_skill(name, language=language))
+        for name in models.Photo.RENDERED_SKILLS
+    ])
+
+def releaseMonth(release_date):
+    return release_date.strftime('%Y-%m') if release_date else 'unreleased'
+
+############################################################
+# Shards
+
+def shardsFingerprints():
+    """
+    {shard name: fingerprint}, the fingerprint of a shard changes when its data changes.
+    One query on all the photos: their versions change every time they're saved.
+    """
+    idols = hashlib.sha1(json.dumps([
+        [unicode(value) for value in values]
+        for values in models.Idol.objects.order_by('id').values_list()
+    ])).hexdigest()
+    photos_by_month = {}
+    for photo_id, release_date, version in models.Photo.objects.order_by('id').values_list('id', 'release_date', '_cache_version'):
+        photos_by_month.setdefault(releaseMonth(release_date), []).append((photo_id, version))
+    fingerprints = { 'idols': idols }
+    for month, versions in photos_by_month.items():
+        fingerprint = hashlib.sha1(json.dumps(versions)).hexdigest()
+        fingerprints[u'photos/{}'.format(month)] = fingerprint
+        fingerprints[u'skills/{}'.format(month)] = fingerprint
+    return { name: u'{}:{}'.format(EXPORT_VERSION, fingerprint) for name, fingerprint in fingerprints.items() }
+
+def shardContent(name, language):
+    with translation.override(language):
+        if name == 'idols':
+            return [itemToDict(idol) for idol in models.Idol.objects.order_by('id')]
+        kind, month = name.split('/')
+        photos = models.Photo.objects.order_by('release_date', 'id')
+        photos = photos.filter(release_date__isnull=True) if month == 'unreleased' else photos.filter(
+            release_date__year=int(month[:4]), release_date__month=int(month[5:]))
+        if kind == 'photos':
+            return [itemToDict(photo) for photo in photos]
+        return OrderedDict((photo.id, photoSkills(photo, language)) for photo in photos)
+
+def _writeAtomically(path, content):
+    fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(temporary_path, 0644)
+        os.rename(temporary_path, path)
+    except:
+        os.remove(temporary_path)
+        raise
+
+def writeShard(directory, name, language, content):
+    """
+    Writes the shard in a file named after the hash of its content, so it can be cached forever.
+    Returns (file name relative to directory, hash).
+    """
+    data = json.dumps(content, separators=(',', ':'))
+    content_hash = hashlib.sha1(data).hexdigest()[:HASH_LENGTH]
+    file_name = u'{}/{}.{}.json'.format(language, name, content_hash)
+    path = os.path.join(directory, file_name)
+    if not os.path.exists(path):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        _writeAtomically(path, data)
+    return file_name, content_hash
+
+############################################################
+# Export
+
+def loadManifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+def _files(manifest):
+    if not manifest:
+        return set()
+    return set(
+        shard['file'] for shards in manifest['languages'].values() for shard in shards.values()
+    )
+
+def removeUnusedFiles(directory, languages, keep):
+    """
+    Removes the shards of languages that are not in keep.
+    """
+    removed = 0
+    for language in languages:
+        for root, _directories, file_names in os.walk(os.path.join(directory, language)):
+            for file_name in file_names:
+                relative_path = os.path.relpath(os.path.join(root, file_name), directory)
+                if file_name.endswith('.json') and relative_path not in keep:
+                    os.remove(os.path.join(root, file_name))
+                    removed += 1
+    return removed
+
+def exportCatalog(directory, languages=None, force=False):
+    """
+    Writes the shards of the catalog in each language and a manifest listing them.
+    Only the shards with a new fingerprint are generated again, unless force is True.
+    Files of the previous manifest are kept for the clients that still use it.
+    Returns (number of generated shards, number of unchanged shards).
+    """
+    languages = languages or [language for language, _verbose_name in django_settings.LANGUAGES]
+    previous = loadManifest(directory)
+    fingerprints = shardsFingerprints()
+    manifest = { 'version': EXPORT_VERSION, 'generated_date': time.time(), 'languages': {} }
+    if previous and previous.get('version') == EXPORT_VERSION:
+        # Languages not exported this time stay as they were
+        manifest['languages'].update(previous['languages'])
+    generated = unchanged = 0
+    for language in languages:
+        previous_shards = previous['languages'].get(language, {}) if previous else {}
+        shards = manifest['languages'][language] = {}
+        for name, fingerprint in sorted(fingerprints.items()):
+            previous_shard = previous_shards.get(name)
+            if (not force and previous_shard and previous_shard['fingerprint'] == fingerprint
+                and os.path.exists(os.path.join(directory, previous_shard['file']))):
+                shards[name] = previous_shard
+                unchanged += 1
+                continue
+            content = shardContent(name, language)
+            file_name, content_hash = writeShard(directory, name, language, content)
+            shards[name] = { 'file': file_name, 'hash': content_hash, 'fingerprint': fingerprint, 'count': len(content) }
+            generated += 1
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    _writeAtomically(os.path.join(directory, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True))
+    removeUnusedFiles(directory, manifest['languages'].keys(), _files(manifest) | _files(previous))
+    return generated, unchanged
@@ -0,0 +1,73 @@
+import hashlib, json
+from django.db.models import Count, Max, Sum
+from django.utils.translation import get_language
+from majilove import models
+from majilove.magicollections import collectiblePhotoQueryset
+
+# Collectible photos loaded per query while streaming
+CHUNK_SIZE = 200
+
+def collectiblePhotoToDict(collectible_photo):
+    return {
+        'id': collectible_photo.id,
+        'photo': collectible_photo.photo_id,
+        'name': unicode(collectible_photo.photo),
+        'level': collectible_photo.level,
+        'rank': collectible_photo.rank,
+        'skill_level': collectible_photo.skill_level,
+        'sub_skill_level': collectible_photo.sub_skill_level,
+        'moments_unlocked': collectible_photo.moments_unlocked,
+        'special_shot_unlocked': collectible_photo.special_shot_unlocked,
+        'display_dance': collectible_photo.display_dance,
+        'display_vocal': collectible_photo.display_vocal,
+        'display_charm': collectible_photo.display_charm,
+        'total_stats': collectible_photo.total_stats,
+        'skill': collectible_photo.skill,
+        'sub_skill': collectible_photo.sub_skill,
+        'leader_skill': collectible_photo.leader_skill,
+        'leader_skill_percentage': collectible_photo.final_leader_skill_percentage,
+    }
+
+def streamCollection(account):
+    """
+    Yields the JSON of the collection of account in pieces, loading CHUNK_SIZE collectible photos at a time,
+    so memory stays the same however big the collection is.
+    """
+    yield u'{{"account": {}, "photos": ['.format(account.id)
+    queryset = collectiblePhotoQueryset(models.CollectiblePhoto.objects.filter(account=account)).order_by('id')
+    last_id, first = 0, True
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        for collectible_photo in chunk:
+            yield (u'' if first else u', ') + json.dumps(collectiblePhotoToDict(collectible_photo))
+            first = False
+        last_id = chunk[-1].id
+    yield u']}'
+
+def _state(account_id):
+    return models.CollectiblePhoto.objects.filter(account_id=account_id).aggregate(
+        count=Count('id'), last_update=Max('_cache_stats_last_update'), photos_versions=Sum('photo___cache_version'),
+    )
+
+def collectionLastModified(account_id, state=None):
+    """
+    Last time a collectible photo of the account was saved, deleted or had its stats refreshed.
+    """
+    dates = [
+        models.AccountCollectionSummary.objects.filter(account_id=account_id).values_list('last_update', flat=True).first(),
+        (state or _state(account_id))['last_update'],
+    ]
+    dates = [date for date in dates if date is not None]
+    return max(dates) if dates else None
+
+def collectionETag(account_id):
+    """
+    Changes with the collectible photos of the account, the photos they're based on and the language of the texts.
+    """
+    state = _state(account_id)
+    return hashlib.md5(u'{}:{}:{}:{}:{}:{}'.format(
+        account_id, get_language(), state['count'], state['last_update'], state['photos_versions'],
+        collectionLastModified(account_id, state=state),
+    )).hexdigest()
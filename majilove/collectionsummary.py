@@ -0,0 +1,114 @@
+import heapq
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from majilove import models
+from majilove.teams import TEAM_SIZE
+
+RARITY_FIELDS = [u'{}_photos'.format(rarity.lower()) for rarity in models.Photo.RARITIES.keys()]
+COLOR_FIELDS = [u'{}_photos'.format(color) for color, _verbose_name in models.Photo.COLOR_CHOICES]
+
+def _completion(unique_photos, total_photos_in_catalog):
+    return unique_photos * 100. / total_photos_in_catalog if total_photos_in_catalog else 0
+
+def summaryValues(account_id, catalog_size=None):
+    """
+    Values of the summary of an account, from a few aggregate queries on its collectible photos.
+    """
+    photos = models.CollectiblePhoto.objects.filter(account_id=account_id)
+    values = { field: 0 for field in RARITY_FIELDS + COLOR_FIELDS }
+    for row in photos.values('photo__i_rarity').annotate(count=Count('id')):
+        values[RARITY_FIELDS[row['photo__i_rarity']]] = row['count']
+    for row in photos.values('photo__i_color').annotate(count=Count('id')):
+        values[COLOR_FIELDS[row['photo__i_color']]] = row['count']
+    values['total_photos'] = sum(values[field] for field in RARITY_FIELDS)
+    values['unique_photos'] = photos.values('photo_id').distinct().count()
+    values['completion_percentage'] = _completion(values['unique_photos'], models.Photo.objects.count() if catalog_size is None else catalog_size)
+    values['team_power'] = sum(total or 0 for total in photos.order_by('-_cache_stats_total').values_list('_cache_stats_total', flat=True)[:TEAM_SIZE])
+    return values
+
+def updateSummary(account_id):
+    if not models.Account.objects.filter(pk=account_id).exists():
+        models.AccountCollectionSummary.objects.filter(account_id=account_id).delete()
+        return
+    values = summaryValues(account_id)
+    values['last_update'] = timezone.now()
+    if not models.AccountCollectionSummary.objects.filter(account_id=account_id).update(**values):
+        models.AccountCollectionSummary.objects.create(account_id=account_id, **values)
+
+def updateCompletions():
+    """
+    Updates the completion of all the summaries at once when the size of the catalog changes.
+    """
+    catalog_size = models.Photo.objects.count()
+    if catalog_size:
+        models.AccountCollectionSummary.objects.update(completion_percentage=F('unique_photos') * 100. / catalog_size)
+
+class _SummaryBuilder(object):
+    def __init__(self, account_id, catalog_size, now):
+        self.account_id = account_id
+        self.catalog_size = catalog_size
+        self.now = now
+        self.counts = { field: 0 for field in RARITY_FIELDS + COLOR_FIELDS }
+        self.unique_photos = set()
+        self.team = []
+
+    def add(self, photo_id, i_rarity, i_color, total):
+        self.counts[RARITY_FIELDS[i_rarity]] += 1
+        self.counts[COLOR_FIELDS[i_color]] += 1
+        self.unique_photos.add(photo_id)
+        if len(self.team) < TEAM_SIZE:
+            heapq.heappush(self.team, total or 0)
+        else:
+            heapq.heappushpop(self.team, total or 0)
+
+    def summary(self):
+        return models.AccountCollectionSummary(
+            account_id=self.account_id,
+            last_update=self.now,
+            total_photos=sum(self.counts[field] for field in RARITY_FIELDS),
+            unique_photos=len(self.unique_photos),
+            completion_percentage=_completion(len(self.unique_photos), self.catalog_size),
+            team_power=sum(self.team),
+            **self.counts
+        )
+
+def _saveSummaries(summaries):
+    with transaction.atomic():
+        models.AccountCollectionSummary.objects.filter(account_id__in=[summary.account_id for summary in summaries]).delete()
+        models.AccountCollectionSummary.objects.bulk_create(summaries)
+
+def rebuildSummaries(chunk_size=1000):
+    """
+    Rebuilds the summaries of all the accounts from one pass over all the collectible photos
+    ordered by account, saving chunk_size summaries at a time.
+    Returns the number of summaries.
+    """
+    catalog_size = models.Photo.objects.count()
+    now = timezone.now()
+    pending, done = [], set()
+    builder = None
+    for account_id, photo_id, i_rarity, i_color, total in models.CollectiblePhoto.objects.order_by('account_id').values_list(
+            'account_id', 'photo_id', 'photo__i_rarity', 'photo__i_color', '_cache_stats_total').iterator():
+        if builder is None or builder.account_id != account_id:
+            if builder is not None:
+                pending.append(builder.summary())
+            builder = _SummaryBuilder(account_id, catalog_size, now)
+            done.add(account_id)
+            if len(pending) >= chunk_size:
+                _saveSummaries(pending)
+                pending = []
+        builder.add(photo_id, i_rarity, i_color, total)
+    if builder is not None:
+        pending.append(builder.summary())
+    # Accounts without any collectible photo
+    for account_id in models.Account.objects.values_list('id', flat=True).iterator():
+        if account_id not in done:
+            done.add(account_id)
+            pending.append(_SummaryBuilder(account_id, catalog_size, now).summary())
+        if len(pending) >= chunk_size:
+            _saveSummaries(pending)
+            pending = []
+    if pending:
+        _saveSummaries(pending)
+    return len(done)
@@ -0,0 +1,51 @@
+import random, threading
+from django.conf import settings as django_settings
+
+PRIMARY = 'default'
+
+# Models of the app read from the replicas: the catalog and the collection pages
+REPLICATED_MODELS = ['idol', 'photo', 'account', 'collectiblephoto', 'accountcollectionsummary', 'searchngram']
+
+# State of the request handled by the current thread, see majilove.middleware.readReplicas
+state = threading.local()
+
+def replicas():
+    aliases = getattr(django_settings, 'READ_REPLICAS', None)
+    if aliases is None:
+        aliases = [alias for alias in django_settings.DATABASES.keys() if alias != PRIMARY]
+    return aliases
+
+def replicated(model):
+    return model._meta.app_label == 'majilove' and model._meta.model_name in REPLICATED_MODELS
+
+def useReplicas(enabled):
+    state.use_replicas = enabled
+    state.wrote = False
+
+def wrote():
+    return getattr(state, 'wrote', False)
+
+class ReadReplicaRouter(object):
+    """
+    Reads of the catalog and collection models go to a random replica during GET requests of users
+    who didn't write recently. Everything else, including management commands, uses the primary.
+    """
+    def db_for_read(self, model, **hints):
+        if not getattr(state, 'use_replicas', False) or not replicated(model):
+            return PRIMARY
+        aliases = replicas()
+        return random.choice(aliases) if aliases else PRIMARY
+
+    def db_for_write(self, model, **hints):
+        if replicated(model):
+            # The rest of the request reads what it wrote
+            state.wrote = True
+            state.use_replicas = False
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, model):
+        return db == PRIMARY
@@ -0,0 +1,79 @@
+import uuid
+from django.core.cache import cache
+from django.db.models import Count
+from majilove import models
+
+# Filter parameter of the photo list: column
+FACETS = [
+    ('i_rarity', 'i_rarity'),
+    ('i_color', 'i_color'),
+    ('i_skill_type', 'i_skill_type'),
+    ('idol', 'idol_id'),
+]
+
+CACHE_KEY = 'majilove:photo_facets'
+VERSION_KEY = 'majilove:photo_facets_version'
+# Older versions are never read again
+CACHE_TIMEOUT = 60 * 60 * 24
+
+def version():
+    """
+    Replaced by invalidate when photos are saved or deleted, and after the bulk updates of import_master_data.
+    Processes only see the changes made by the others with a cache shared by all of them, like memcached.
+    """
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        # Random, so a lost version doesn't go back to the counts of an older one
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        current = cache.get(VERSION_KEY)
+    return current
+
+def invalidate():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+def cube():
+    """
+    Number of photos for each combination of FACETS, as a list of (values, count),
+    from one GROUP BY query cached until invalidate is called.
+    """
+    key = u'{}:{}'.format(CACHE_KEY, version())
+    counts = cache.get(key)
+    if counts is None:
+        columns = [column for _parameter, column in FACETS]
+        counts = [
+            (tuple(row[column] for column in columns), row['count'])
+            for row in models.Photo.objects.values(*columns).annotate(count=Count('id')).order_by()
+        ]
+        cache.set(key, counts, CACHE_TIMEOUT)
+    return counts
+
+def _filters(parameters):
+    filters = {}
+    for i, (parameter, _column) in enumerate(FACETS):
+        value = parameters.get(parameter)
+        if value not in (None, ''):
+            try:
+                filters[i] = int(value)
+            except (TypeError, ValueError):
+                pass
+    return filters
+
+def photoFacets(parameters):
+    """
+    {filter parameter: {option: number of photos}} for the photo list filtered with parameters.
+    The counts of the options of a filter apply all the other filters, so they show what selecting it would give.
+    """
+    filters = _filters(parameters)
+    facets = { parameter: {} for parameter, _column in FACETS }
+    total = 0
+    for values, count in cube():
+        mismatches = [i for i, value in filters.items() if values[i] != value]
+        if not mismatches:
+            total += count
+        if len(mismatches) > 1:
+            continue
+        for i, (parameter, _column) in enumerate(FACETS):
+            if not mismatches or mismatches == [i]:
+                facets[parameter][values[i]] = facets[parameter].get(values[i], 0) + count
+    facets['total'] = total
+    return facets
@@ -0,0 +1,123 @@
+import cPickle as pickle
+import hashlib, os, tempfile, threading
+from collections import OrderedDict
+from django.conf import settings as django_settings
+
+############################################################
+# Backends
+
+class MemoryBackend(object):
+    """
+    Bounded local memory cache, evicts the least recently used entries.
+    """
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.pop(key, None)
+            if value is not None:
+                self.entries[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class FileBackend(object):
+    """
+    Pickled entries in a directory, shared by all the processes of a server.
+    Old versions are never read again and can be removed with clear.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        fd, temporary_path = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(temporary_path, self._path(key))
+
+    def clear(self):
+        for file_name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, file_name))
+
+############################################################
+# Cache
+
+class FragmentCache(object):
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_set(self, key, function):
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return _copyFields(value)
+        self.misses += 1
+        value = function()
+        self.backend.set(key, _copyFields(value))
+        return value
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / total if total else None,
+        }
+
+def _copyFields(fields):
+    # Views add to or change the fields they get, cached fields must not be shared
+    return OrderedDict((name, dict(field) if isinstance(field, dict) else field) for name, field in fields.items())
+
+def fragmentCacheFromSettings():
+    settings = getattr(django_settings, 'PHOTO_FRAGMENT_CACHE', {})
+    if settings.get('backend') == 'file':
+        backend = FileBackend(settings.get('directory', os.path.join(tempfile.gettempdir(), 'majilove_fragment_cache')))
+    else:
+        backend = MemoryBackend(max_entries=settings.get('max_entries', 5000))
+    return FragmentCache(backend)
+
+photo_fields_cache = fragmentCacheFromSettings()
+
+def photoFieldsKey(view_name, item, language, kwargs):
+    """
+    Key of the fields of a photo, or None when kwargs make them uncacheable.
+    Fields can depend on the user (owned cards, staff buttons), so only anonymous requests are cached.
+    """
+    request = kwargs.get('request') or getattr(item, 'request', None)
+    if request is None or not hasattr(request, 'user') or request.user.is_authenticated():
+        return None
+    options = []
+    for name, value in sorted(kwargs.items()):
+        if name == 'request':
+            continue
+        if value is not None and not isinstance(value, (basestring, int, long, bool)):
+            return None
+        options.append(u'{}={}'.format(name, value))
+    return u'photo:{}:{}:{}:{}:{}'.format(view_name, item.pk, language, item._cache_version, u','.join(options))
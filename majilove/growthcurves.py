@@ -0,0 +1,83 @@
+import json
+import numpy as np
+from django.core.cache import cache
+from majilove import models
+
+MAX_PHOTOS = 10
+
+# UR photos can unlock up to that many squares past 100% of their moments
+UR_BONUS_MOMENT_SQUARES = 16
+
+CURVE_FIELDS = ['id', 'i_rarity', 'i_color', '_cache_level_curve', '_cache_version'] + [
+    u'{}_{}'.format(stat, field)
+    for stat in models.Photo.STATISTICS.keys()
+    for field in ['min', 'single_copy_max', 'max_copy_max']
+]
+
+# Curves of each version of each photo
+CACHE_KEY = u'majilove:photo_curves:{}:{}'
+
+_moment_bonuses = {}
+
+def momentBonuses(rarity):
+    """
+    {stat: [bonus with 0 square unlocked, 1 square, ...]} up to all the squares of a photo of that rarity,
+    same as moment_*_bonus of CollectiblePhoto.
+    """
+    if rarity not in _moment_bonuses:
+        squares = models.Photo.RARITIES[rarity]['squares_in_moments'] + (UR_BONUS_MOMENT_SQUARES if rarity == 'UR' else 0)
+        unlocked = np.arange(squares + 1)
+        _moment_bonuses[rarity] = {
+            'dance': (np.ceil(unlocked / 4.) * 30).astype(int).tolist(),
+            'vocal': ((unlocked // 4 + (unlocked % 4 >= 2)) * 30).tolist(),
+            'charm': ((unlocked // 4 + (unlocked % 4 >= 3)) * 30).tolist(),
+        }
+    return _moment_bonuses[rarity]
+
+def photoCurves(photo):
+    """
+    Stats of photo at each level from 1 to max_max_level, read from the level curve cached on the photo.
+    """
+    if not photo._cache_level_curve:
+        photo.update_cache_level_curve()
+    curve = np.array(json.loads(photo._cache_level_curve)).reshape(-1, len(models.Photo.STATISTICS))
+    curves = {
+        stat: curve[:, i].tolist()
+        for i, stat in enumerate(models.Photo.STATISTICS.keys())
+    }
+    curves['total'] = curve.sum(axis=1).tolist()
+    return {
+        'id': photo.id,
+        'rarity': photo.rarity,
+        'color': photo.color,
+        'single_max_level': photo.single_max_level,
+        'max_max_level': photo.max_max_level,
+        'curves': curves,
+        'moment_bonuses': momentBonuses(photo.rarity),
+    }
+
+def compare(photo_ids):
+    """
+    Curves of the photos, in the order of photo_ids, skipping unknown photos.
+    """
+    photo_ids = photo_ids[:MAX_PHOTOS]
+    keys = {
+        photo_id: CACHE_KEY.format(photo_id, version)
+        for photo_id, version in models.Photo.objects.filter(id__in=photo_ids).values_list('id', '_cache_version')
+    }
+    curves = cache.get_many(keys.values())
+    missing = [photo_id for photo_id, key in keys.items() if key not in curves]
+    if missing:
+        computed = {
+            keys[photo.id]: photoCurves(photo)
+            for photo in models.Photo.objects.filter(id__in=missing).only(*CURVE_FIELDS)
+        }
+        cache.set_many(computed, None)
+        curves.update(computed)
+    return {
+        'photos': [curves[keys[photo_id]] for photo_id in photo_ids if photo_id in keys],
+        'crowns': {
+            'types': models.CollectiblePhoto.CROWN_TYPES,
+            'amounts': models.CollectiblePhoto.CROWN_OPTIONS,
+        },
+    }
@@ -0,0 +1,85 @@
+import hashlib, json, logging
+from cStringIO import StringIO
+from PIL import Image
+from django.conf import settings as django_settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+
+logger = logging.getLogger(__name__)
+
+# Widths of the resized derivatives, images smaller than a width are not upscaled
+DERIVATIVE_WIDTHS = getattr(django_settings, 'IMAGE_DERIVATIVE_WIDTHS', [200, 400, 800])
+DERIVATIVE_JPEG_QUALITY = 85
+
+# Images with transparency stay PNG
+TRANSPARENT_FIELDS = ['transparent', 'transparent_special_shot', 'autograph']
+
+def derivativePath(content_hash, width, extension):
+    return u'derivatives/{}/{}_{}.{}'.format(content_hash[:2], content_hash, width, extension)
+
+def generateDerivatives(image_file, transparent=False):
+    """
+    Returns {width: path} of the resized derivatives of image_file.
+    Derivatives are named after the hash of the content, so the same image is only processed once.
+    """
+    image_file.open('rb')
+    try:
+        content = image_file.read()
+    finally:
+        image_file.close()
+    content_hash = hashlib.sha1(content).hexdigest()
+    extension = 'png' if transparent else 'jpg'
+    paths = {}
+    image = None
+    for width in DERIVATIVE_WIDTHS:
+        path = derivativePath(content_hash, width, extension)
+        if not default_storage.exists(path):
+            if image is None:
+                image = Image.open(StringIO(content))
+                image = image.convert('RGBA' if transparent else 'RGB')
+            if image.size[0] <= width and paths:
+                break
+            resized = image.copy()
+            resized.thumbnail((width, image.size[1]), Image.ANTIALIAS)
+            output = StringIO()
+            if transparent:
+                resized.save(output, 'PNG', optimize=True)
+            else:
+                resized.save(output, 'JPEG', quality=DERIVATIVE_JPEG_QUALITY, optimize=True, progressive=True)
+            default_storage.save(path, ContentFile(output.getvalue()))
+        paths[width] = path
+    return paths
+
+def generatePhotoDerivatives(photo_id, field_names=None):
+    """
+    Generates the derivatives of the images in field_names (all of them when None) and stores them
+    with the derivatives of the other images of the photo.
+    Returns the derivatives of all the images.
+    """
+    from majilove.models import Photo
+    photo = Photo.objects.get(pk=photo_id)
+    generated = {}
+    for field_name in (Photo.IMAGE_FIELDS if field_names is None else field_names):
+        image_file = getattr(photo, field_name)
+        generated[field_name] = None
+        if not image_file:
+            continue
+        try:
+            generated[field_name] = generateDerivatives(image_file, transparent=field_name in TRANSPARENT_FIELDS)
+        except (IOError, ValueError), e:
+            logger.warning(u'Could not generate derivatives of photo #{} {}: {}'.format(photo_id, field_name, e))
+    with transaction.atomic():
+        # Jobs of other images of the same photo may have finished in the meantime
+        current = Photo.objects.select_for_update().filter(pk=photo_id).values_list('_cache_image_derivatives', flat=True).first()
+        derivatives = json.loads(current) if current else {}
+        for field_name, paths in generated.items():
+            if paths:
+                derivatives[field_name] = paths
+            else:
+                derivatives.pop(field_name, None)
+        Photo.objects.filter(pk=photo_id).update(
+            _cache_image_derivatives=json.dumps(derivatives),
+            _cache_version=models.F('_cache_version') + 1,
+        )
+    return derivatives
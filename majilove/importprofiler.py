@@ -0,0 +1,54 @@
+"""
+Times the imports of a fresh interpreter. Run as a script so nothing is imported yet:
+    python -m majilove.importprofiler [module ...]
+Prints a JSON list of [module, cumulative seconds, self seconds] in import order.
+"""
+import __builtin__, json, os, sys, timeit
+
+_original_import = __builtin__.__import__
+_children_time = []
+records = []
+
+def _resolvedName(name, new_modules):
+    if name in new_modules:
+        return name
+    # Implicit relative imports: "models" from majilove is majilove.models
+    for module_name in new_modules:
+        if module_name.endswith(u'.' + name):
+            return module_name
+    return name
+
+def _timedImport(name, *args, **kwargs):
+    before = set(sys.modules.keys())
+    _children_time.append(0.)
+    start = timeit.default_timer()
+    try:
+        return _original_import(name, *args, **kwargs)
+    finally:
+        elapsed = timeit.default_timer() - start
+        children = _children_time.pop()
+        if _children_time:
+            _children_time[-1] += elapsed
+        new_modules = [
+            module_name for module_name in sys.modules.keys()
+            if module_name not in before and sys.modules[module_name] is not None
+        ]
+        if new_modules:
+            records.append((_resolvedName(name, new_modules), elapsed, elapsed - children))
+
+def profile(modules):
+    __builtin__.__import__ = _timedImport
+    try:
+        start = timeit.default_timer()
+        import django
+        django.setup()
+        records.append(('django.setup', timeit.default_timer() - start, 0.))
+        for module in modules:
+            __import__(module)
+    finally:
+        __builtin__.__import__ = _original_import
+    return records
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'majilove_project.settings')
+    print json.dumps(profile(sys.argv[1:]))
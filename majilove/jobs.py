@@ -0,0 +1,213 @@
+import datetime, json, logging, os, socket, threading, time, traceback
+from django.conf import settings as django_settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from majilove import models
+
+logger = logging.getLogger(__name__)
+
+# Index in Job.STATUS_CHOICES
+PENDING, RUNNING, FAILED = range(3)
+
+# Seconds before retrying a failed job, doubled after each attempt
+RETRY_DELAY = getattr(django_settings, 'JOBS_RETRY_DELAY', 30)
+# Running jobs older than that are considered lost with their worker and run again
+STALE_AFTER = getattr(django_settings, 'JOBS_STALE_AFTER', 3600)
+# Seconds between polls of idle workers
+POLL_INTERVAL = getattr(django_settings, 'JOBS_POLL_INTERVAL', 1)
+# Run the jobs right away instead of enqueuing them, for local development without a worker
+EAGER = getattr(django_settings, 'JOBS_EAGER', False)
+
+############################################################
+# Tasks
+
+# {name: (function, priority, max attempts)}
+TASKS = {}
+
+def task(priority=0, max_attempts=5):
+    """
+    Registers a function that can be enqueued by name, with JSON keyword arguments.
+    Jobs with a higher priority run first.
+    """
+    def decorator(function):
+        TASKS[function.__name__] = (function, priority, max_attempts)
+        return function
+    return decorator
+
+@task(priority=10)
+def update_account_collection_summary(account_id):
+    from majilove.collectionsummary import updateSummary
+    updateSummary(account_id)
+
+@task(priority=10)
+def update_account_ranks():
+    from majilove.leaderboard import rebuildRanks
+    # Enqueued with the same key for all accounts: one runs at a time, from the current levels,
+    # so the ranks are right whatever the order of the level changes
+    rebuildRanks(only_changed=True)
+
+@task(priority=5)
+def refresh_idol_cache(idol_id):
+    from majilove.search import indexItems
+    idol = models.Idol.objects.filter(pk=idol_id).first()
+    if idol is None:
+        return
+    models.Photo.update_cache_idol_for_idol(idol)
+    indexItems('idol', [idol])
+    # Photos are indexed with the names of their idol
+    indexItems('photo', models.Photo.objects.filter(idol_id=idol.id))
+
+@task(priority=5)
+def index_photo(photo_id):
+    from majilove.search import indexItems
+    indexItems('photo', models.Photo.objects.filter(pk=photo_id))
+
+@task(priority=5)
+def update_collectible_photos_stats(photo_id):
+    models.CollectiblePhoto.update_cache_stats_for_queryset(models.CollectiblePhoto.objects.filter(photo_id=photo_id))
+
+@task()
+def update_collection_completions():
+    from majilove.collectionsummary import updateCompletions
+    updateCompletions()
+
+@task()
+def generate_settings():
+    from majilove.management.commands.generate_settings import generate_settings
+    generate_settings()
+
+@task(priority=-5, max_attempts=3)
+def generate_photo_image_derivatives(photo_id, field_names=None):
+    from majilove.images import generatePhotoDerivatives
+    if models.Photo.objects.filter(pk=photo_id).exists():
+        generatePhotoDerivatives(photo_id, field_names=field_names)
+
+############################################################
+# Queue
+
+def enqueue(name, key=None, priority=None, delay=0, **arguments):
+    """
+    Adds a job running the task name with arguments.
+    When a pending job has the same key, it's kept instead, with the highest of both priorities.
+    Returns the job, or None when EAGER ran it right away.
+    """
+    function, default_priority, max_attempts = TASKS[name]
+    if priority is None:
+        priority = default_priority
+    if EAGER:
+        function(**arguments)
+        return None
+    if key is not None:
+        pending = models.Job.objects.filter(key=key, i_status=PENDING)
+        job = pending.first()
+        if job is not None:
+            pending.filter(priority__lt=priority).update(priority=priority)
+            return job
+    return models.Job.objects.create(
+        name=name, key=key, priority=priority, max_attempts=max_attempts,
+        arguments=json.dumps(arguments), run_after=timezone.now() + datetime.timedelta(seconds=delay),
+    )
+
+def claim(worker):
+    """
+    Marks the next job as running for worker and returns it, None when there's nothing to do.
+    A job can only be claimed by one worker: the update only succeeds while it's still pending.
+    Jobs with the same key as a running job wait for it to be done.
+    """
+    now = timezone.now()
+    running_keys = models.Job.objects.filter(i_status=RUNNING, key__isnull=False).values_list('key', flat=True)
+    for job_id in models.Job.objects.filter(i_status=PENDING, run_after__lte=now).exclude(key__in=running_keys).order_by(
+            '-priority', 'id').values_list('id', flat=True)[:10]:
+        if models.Job.objects.filter(id=job_id, i_status=PENDING).update(
+                i_status=RUNNING, worker=worker, started_at=now, attempts=F('attempts') + 1):
+            return models.Job.objects.get(id=job_id)
+    return None
+
+def runJob(job):
+    """
+    Runs a claimed job. Successful jobs are deleted, failed ones are retried later until max_attempts.
+    Returns True when it succeeded.
+    """
+    try:
+        if job.name not in TASKS:
+            raise KeyError(u'Unknown task {}'.format(job.name))
+        TASKS[job.name][0](**json.loads(job.arguments))
+    except Exception:
+        error = traceback.format_exc()
+        retry = job.attempts < job.max_attempts
+        logger.warning(u'Job {} failed (attempt {}/{}): {}'.format(job, job.attempts, job.max_attempts, error))
+        models.Job.objects.filter(id=job.id).update(
+            i_status=PENDING if retry else FAILED, last_error=error,
+            run_after=timezone.now() + datetime.timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1)),
+        )
+        return False
+    models.Job.objects.filter(id=job.id).delete()
+    return True
+
+def resetStaleJobs():
+    return models.Job.objects.filter(
+        i_status=RUNNING, started_at__lt=timezone.now() - datetime.timedelta(seconds=STALE_AFTER),
+    ).update(i_status=PENDING, worker=None)
+
+############################################################
+# Workers
+
+def workerName(thread=0):
+    return u'{}:{}:{}'.format(socket.gethostname(), os.getpid(), thread)
+
+def work(worker, stop=None, once=False):
+    """
+    Runs jobs until stop is set, or until there are no more jobs to run when once is True.
+    Returns the number of jobs run.
+    """
+    done = 0
+    try:
+        while stop is None or not stop.is_set():
+            job = claim(worker)
+            if job is None:
+                if once:
+                    break
+                resetStaleJobs()
+                time.sleep(POLL_INTERVAL)
+                continue
+            runJob(job)
+            done += 1
+    finally:
+        # Each thread has its own connection
+        connection.close()
+    return done
+
+def runWorkers(concurrency=1, once=False):
+    """
+    Runs concurrency worker threads until interrupted.
+    """
+    resetStaleJobs()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=work, args=(workerName(i), stop, once))
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(1)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+def runPending():
+    """
+    Runs all the jobs that can run now in the current thread. Returns the number of jobs run.
+    """
+    done = 0
+    while True:
+        job = claim(workerName())
+        if job is None:
+            return done
+        runJob(job)
+        done += 1
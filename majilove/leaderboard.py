@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.utils import timezone
+from majilove import models
+
+def rank(level):
+    """
+    1 + the number of accounts with a higher level, None for accounts without a level.
+    """
+    if level is None:
+        return None
+    return models.Account.objects.filter(level__gt=level).count() + 1
+
+def rebuildRanks(chunk_size=1000, only_changed=False):
+    """
+    Recomputes the ranks of all the accounts from a single sorted scan of their current levels,
+    writing accounts with the same rank together, chunk_size at a time.
+    With only_changed, only the accounts with a different rank are written.
+    Returns the number of written ranked accounts.
+    """
+    now = timezone.now()
+    unranked = models.Account.objects.filter(level__isnull=True)
+    if only_changed:
+        unranked = unranked.filter(_cache_leaderboard__isnull=False)
+    unranked.update(_cache_leaderboard=None, _cache_leaderboards_last_update=now)
+    ranks = []
+    current_rank, previous_level = 0, None
+    for position, (account_id, level, cached_rank) in enumerate(models.Account.objects.filter(
+            level__isnull=False).order_by('-level').values_list('id', 'level', '_cache_leaderboard').iterator()):
+        if level != previous_level:
+            current_rank, previous_level = position + 1, level
+            ranks.append((current_rank, []))
+        if not only_changed or cached_rank != current_rank:
+            ranks[-1][1].append(account_id)
+    total = 0
+    for account_rank, account_ids in ranks:
+        for start in range(0, len(account_ids), chunk_size):
+            with transaction.atomic():
+                models.Account.objects.filter(id__in=account_ids[start:start + chunk_size]).update(
+                    _cache_leaderboard=account_rank, _cache_leaderboards_last_update=now)
+        total += len(account_ids)
+    return total
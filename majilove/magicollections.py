@@ -1,8 +1,13 @@
-from django.utils.translation import ugettext_lazy as _
-from magi.magicollections import MagiCollection, ActivityCollection as _ActivityCollection, BadgeCollection as _BadgeCollection, StaffConfigurationCollection as _StaffConfigurationCollection, DonateCollection as _DonateCollection
+from django.utils.translation import ugettext_lazy as _, get_language
+from magi.magicollections import MagiCollection, AccountCollection as _AccountCollection, ActivityCollection as _ActivityCollection, BadgeCollection as _BadgeCollection, StaffConfigurationCollection as _StaffConfigurationCollection, DonateCollection as _DonateCollection
 from magi.default_settings import RAW_CONTEXT
 from majilove import models, forms
 from magi.utils import staticImageURL
+from django.core.files.storage import default_storage
+from majilove.search import searchQueryset
+from majilove.fragmentcache import photo_fields_cache, photoFieldsKey
+from majilove.facets import FACETS, photoFacets
+from majilove.pagination import keysetQueryset, encodeToken, TOKEN_PARAMETER, PHOTOS_KEYS
 
 ############################################################
 # Activities
@@ -28,6 +33,42 @@ class StaffConfigurationCollection(_StaffConfigurationCollection):
 class DonateCollection(_DonateCollection):
     enabled = True
 
+############################################################
+# Account Collection
+
+def collectionSummaryFields(account):
+    """
+    Fields of the summary of the collection of an account, none until it has been computed.
+    """
+    # Missing related objects raise an AttributeError
+    summary = getattr(account, 'collection_summary', None)
+    if summary is None:
+        return []
+    return [
+        ('collection', {
+            'verbose_name': _('Collection'),
+            'type': 'text',
+            'value': u'{} ({:.0f}%)'.format(summary.unique_photos, summary.completion_percentage),
+            'icon': 'cards',
+        }),
+        ('team_power', {
+            'verbose_name': _('Team power'),
+            'type': 'text',
+            'value': int(summary.team_power),
+            'icon': 'deck',
+        }),
+    ]
+
+class AccountCollection(_AccountCollection):
+    def to_fields(self, view, item, *args, **kwargs):
+        extra_fields = (kwargs.pop('extra_fields', None) or []) + collectionSummaryFields(item)
+        return super(AccountCollection, self).to_fields(view, item, *args, extra_fields=extra_fields, **kwargs)
+
+    class ListView(_AccountCollection.ListView):
+        def get_queryset(self, queryset, parameters, request):
+            queryset = super(AccountCollection.ListView, self).get_queryset(queryset, parameters, request)
+            return queryset.select_related('collection_summary')
+
 ############################################################
 # Idol Collection
 
@@ -45,6 +86,14 @@ class IdolCollection(MagiCollection):
     reportable = False
     blockable = False
 
+    class ListView(MagiCollection.ListView):
+        def get_queryset(self, queryset, parameters, request):
+            queryset = super(IdolCollection.ListView, self).get_queryset(queryset, parameters, request)
+            if parameters.get('search'):
+                # Ordered by rank unless another ordering is asked
+                queryset = searchQueryset(queryset, 'idol', parameters['search'], ranked=not parameters.get('ordering'))
+            return queryset
+
 ############################################################
 # Photo Collection
 
@@ -76,6 +125,88 @@ PHOTOS_ORDER = [
     'id', 'name', 'idol', 'rarity', 'color', 'release_date', 'skill', 'sub_skill', 'images', 'full_photos', 'arts', 'transparents',
 ] + PHOTO_STATS_FIELDS
 
+# Columns of Photo that are never displayed in lists
+PHOTO_LIST_DEFERRED_FIELDS = [
+    'message_text', 'message_translation', 'd_message_translations', '_cache_image_derivatives',
+]
+
+# Columns of Idol that are not needed to display photos
+PHOTO_IDOL_DEFERRED_FIELDS = [
+    u'idol__{}'.format(_field) for _field in [
+        'description', 'd_descriptions', 'd_instruments', 'd_hometowns', 'd_hobbys',
+    ]
+]
+
+def photoListQueryset(queryset):
+    return queryset.select_related('idol').defer(*(PHOTO_LIST_DEFERRED_FIELDS + PHOTO_IDOL_DEFERRED_FIELDS))
+
+def photoItemQueryset(queryset):
+    return queryset.select_related('idol')
+
+def collectiblePhotoQueryset(queryset):
+    return queryset.select_related('photo').defer(*[
+        u'photo__{}'.format(_field) for _field in PHOTO_LIST_DEFERRED_FIELDS
+    ])
+
+# Width of the derivative shown instead of the original image
+PHOTO_IMAGE_DEFAULT_WIDTH = '400'
+
+def photoImage(item, field_name, verbose_name):
+    """
+    Image of a photo, served from its resized derivatives when they have been generated.
+    """
+    derivatives = item.image_derivatives.get(field_name)
+    if not derivatives:
+        return { 'value': getattr(item, u'{}_url'.format(field_name)), 'verbose_name': verbose_name }
+    default_width = PHOTO_IMAGE_DEFAULT_WIDTH if PHOTO_IMAGE_DEFAULT_WIDTH in derivatives else max(derivatives.keys(), key=int)
+    return {
+        'value': default_storage.url(derivatives[default_width]),
+        'verbose_name': verbose_name,
+    }
+
+def addNextPageToken(context, keys):
+    """
+    Token of the page after the displayed items and the query string of that page,
+    which replaces the page offset.
+    """
+    items = list(context.get('items') or [])
+    # The total is counted from the token, so it's only the items left
+    has_next_page = bool(items) and context.get('total_results', len(items) + 1) > len(items)
+    context['next_page_token'] = encodeToken(keys, items[-1]) if has_next_page else None
+    context['next_page_query'] = None
+    if context['next_page_token']:
+        parameters = context['request'].GET.copy()
+        parameters.pop('page', None)
+        parameters[TOKEN_PARAMETER] = context['next_page_token']
+        context['next_page_query'] = parameters.urlencode()
+    # Hides magi's pagination
+    context['is_last_page'] = True
+
+def photoFacetsLinks(request):
+    """
+    [(filter, [(option, number of photos, query string, selected)])] for the photo list filtered
+    with the parameters of request, so each option shows what selecting it would give.
+    """
+    counts = photoFacets(request.GET)
+    facets = []
+    for parameter, _column in FACETS:
+        field = models.Photo._meta.get_field(parameter)
+        if field.choices:
+            names = dict(field.choices)
+        else:
+            names = dict(field.rel.to.objects.filter(id__in=counts[parameter].keys()).values_list('id', 'name'))
+        links = []
+        for value, count in sorted(counts[parameter].items()):
+            if value is None:
+                continue
+            parameters = request.GET.copy()
+            parameters.pop('page', None)
+            parameters.pop(TOKEN_PARAMETER, None)
+            parameters[parameter] = value
+            links.append((names.get(value, value), count, parameters.urlencode(), request.GET.get(parameter) == unicode(value)))
+        facets.append((field.verbose_name, links))
+    return facets
+
 class PhotoCollection(MagiCollection):
     queryset = models.Photo.objects.all()
     title = _('Photo')
@@ -90,6 +221,12 @@ class PhotoCollection(MagiCollection):
     translated_fields = ('name', 'message_translation')
 
     def to_fields(self, view, item, *args, **kwargs):
+        key = photoFieldsKey(type(view).__name__, item, get_language(), kwargs) if not args else None
+        if key is None:
+            return self._to_fields(view, item, *args, **kwargs)
+        return photo_fields_cache.get_or_set(key, lambda: self._to_fields(view, item, **kwargs))
+
+    def _to_fields(self, view, item, *args, **kwargs):
         _photo_images = PHOTO_IMAGES.copy()
         _photo_images.update({
             'color': staticImageURL(item.color, folder='color', extension='png'),
@@ -98,8 +235,40 @@ class PhotoCollection(MagiCollection):
         fields = super(PhotoCollection, self).to_fields(view, item, *args, icons=PHOTO_ICONS, images=_photo_images, **kwargs)
         return fields
 
+    class ListView(MagiCollection.ListView):
+        before_template = 'include/photosFacets'
+        after_template = 'include/photosNextPage'
+
+        def get_queryset(self, queryset, parameters, request):
+            queryset = super(PhotoCollection.ListView, self).get_queryset(queryset, parameters, request)
+            if parameters.get('search'):
+                # Ordered by rank unless another ordering is asked
+                return photoListQueryset(searchQueryset(queryset, 'photo', parameters['search'], ranked=not parameters.get('ordering')))
+            if parameters.get('ordering'):
+                return photoListQueryset(queryset)
+            # Magi can't change the ordering, pages start after the token instead of an offset
+            return photoListQueryset(keysetQueryset(queryset, PHOTOS_KEYS, parameters.get(TOKEN_PARAMETER)))
+
+        def extra_context(self, context):
+            super(PhotoCollection.ListView, self).extra_context(context)
+            request = context['request']
+            context['facets'] = photoFacetsLinks(request)
+            if not request.GET.get('search') and not request.GET.get('ordering'):
+                addNextPageToken(context, PHOTOS_KEYS)
+
     class ItemView(MagiCollection.ItemView):
+        def get_queryset(self, queryset, parameters, request):
+            queryset = super(PhotoCollection.ItemView, self).get_queryset(queryset, parameters, request)
+            return photoItemQueryset(queryset)
+
         def to_fields(self, item, extra_fields=None, exclude_fields=None, order=None, *args, **kwargs):
+            key = photoFieldsKey('ItemView', item, get_language(), kwargs) if (
+                extra_fields is None and exclude_fields is None and order is None and not args) else None
+            if key is None:
+                return self._to_fields(item, extra_fields, exclude_fields, order, *args, **kwargs)
+            return photo_fields_cache.get_or_set(key, lambda: self._to_fields(item, **kwargs))
+
+        def _to_fields(self, item, extra_fields=None, exclude_fields=None, order=None, *args, **kwargs):
             if extra_fields is None: extra_fields = []
             if exclude_fields is None: exclude_fields = []
             if order is None: order = PHOTOS_ORDER
@@ -121,13 +290,9 @@ class PhotoCollection(MagiCollection):
                     extra_fields.append((u'{}s'.format(image), {
                         'verbose_name': verbose_name,
                         'type': 'images',
-                        'images': [{
-                            'value': image_url,
-                            'verbose_name': verbose_name,
-                        } for image_url in [
-                            getattr(item, u'{}_url'.format(image)),
-                            getattr(item, u'{}_special_shot_url'.format(image)),
-                        ] if image_url],
+                        'images': [photoImage(item, field_name, verbose_name) for field_name in [
+                            image, u'{}_special_shot'.format(image),
+                        ] if getattr(item, u'{}_url'.format(field_name))],
                         'icon': 'pictures',
                     }))
             return super(PhotoCollection.ItemView, self).to_fields(item, *args, extra_fields=extra_fields, exclude_fields=exclude_fields, order=order, **kwargs)
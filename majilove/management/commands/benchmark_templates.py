@@ -0,0 +1,38 @@
+import timeit
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import translation
+from magi.utils import templateVariables
+from majilove import models
+
+def legacy_skill(photo):
+    return photo.skill_template.format(**{
+        k: getattr(photo, k, '')
+        for k in templateVariables(photo.skill_template)
+    })
+
+def benchmark_templates(number=100000):
+    photo = models.Photo(
+        i_skill_type=models.Photo.SKILL_TYPES.keys().index('cutin'),
+        skill_percentage=12.5,
+        i_color=0,
+        i_leader_skill_stat=models.Photo.STATISTICS.keys().index('dance'),
+        leader_skill_percentage=20,
+    )
+    translation.activate('en')
+    assert legacy_skill(photo) == photo.compute_skill()
+    legacy = min(timeit.repeat(lambda: legacy_skill(photo), number=number, repeat=3))
+    compiled = min(timeit.repeat(photo.compute_skill, number=number, repeat=3))
+    print 'templateVariables: {:.2f}us per access'.format(legacy / number * 1000000)
+    print 'CompiledTemplate: {:.2f}us per access'.format(compiled / number * 1000000)
+    print 'Speedup: {:.1f}x'.format(legacy / compiled)
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '[number]'
+
+    def handle(self, *args, **options):
+        try:
+            number = int(args[0]) if args else 100000
+        except ValueError:
+            raise CommandError('number must be a number')
+        benchmark_templates(number=number)
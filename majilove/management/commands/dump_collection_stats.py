@@ -0,0 +1,10 @@
+import json
+from django.core.management.base import BaseCommand
+from majilove.middleware import collectionStats
+
+class Command(BaseCommand):
+    can_import_settings = True
+    help = 'Prints the query count and latency of each view, from the stats dumped by the workers.'
+
+    def handle(self, *args, **options):
+        print json.dumps(collectionStats.summarize(collectionStats.loadDumps()), indent=2, sort_keys=True)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings as django_settings
+from majilove.catalogexport import exportCatalog
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '<directory> [force] [language ...]'
+    help = 'Writes the idols, photos and skills as content-hashed JSON shards per language, with a manifest. Only changed shards are generated again, unless force is given.'
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('Missing directory')
+        force = 'force' in args[1:]
+        languages = [arg for arg in args[1:] if arg != 'force']
+        unknown = set(languages) - set(language for language, _verbose_name in django_settings.LANGUAGES)
+        if unknown:
+            raise CommandError(u'Unknown languages: {}'.format(u', '.join(unknown)))
+        generated, unchanged = exportCatalog(args[0], languages=languages or None, force=force)
+        print generated, 'shards generated,', unchanged, 'unchanged'
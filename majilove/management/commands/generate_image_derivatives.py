@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from majilove import models
+from majilove.images import generatePhotoDerivatives
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '[photo_id ...]'
+    help = 'Generates the resized derivatives of the images of all the photos, or of the given photos.'
+
+    def handle(self, *args, **options):
+        queryset = models.Photo.objects.all()
+        if args:
+            queryset = queryset.filter(id__in=args)
+        for photo_id in queryset.values_list('id', flat=True):
+            derivatives = generatePhotoDerivatives(photo_id)
+            print 'Photo #{}: {} images'.format(photo_id, len(derivatives))
@@ -1,4 +1,4 @@
-import time, datetime
+import time, datetime, json, hashlib, os, tempfile
 from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from django.conf import settings as django_settings
@@ -33,23 +33,54 @@ def generate_settings():
     # ) for idol in all_idols]
 
     print 'Save generated settings'
-    # STARTERS = ' + unicode(starters) + u'\n\
-    s = u'\
-# -*- coding: utf-8 -*-\n\
-import datetime\n\
-LATEST_NEWS = ' + unicode(latest_news) + u'\n\
-TOTAL_DONATORS = ' + unicode(total_donators) + u'\n\
-STAFF_CONFIGURATIONS = ' + unicode(staff_configurations) + u'\n\
-FAVORITE_CHARACTERS = ' + unicode(favorite_characters) + u'\n\
-GENERATED_DATE = datetime.datetime.fromtimestamp(' + unicode(time.time()) + u')\n\
-'
-    print s
-    with open(django_settings.BASE_DIR + '/' + django_settings.SITE + '_project/generated_settings.py', 'w') as f:
-        f.write(s.encode('utf8'))
-        f.close()
+    saved = saveGeneratedSettings({
+        'LATEST_NEWS': latest_news,
+        'TOTAL_DONATORS': total_donators,
+        'STAFF_CONFIGURATIONS': staff_configurations,
+        'FAVORITE_CHARACTERS': favorite_characters,
+    })
+    print 'Saved' if saved else 'Unchanged, not saved'
+
+def generatedSettingsPath():
+    return os.path.join(django_settings.BASE_DIR, django_settings.SITE + '_project', 'generated_settings.json')
+
+def saveGeneratedSettings(generated_settings):
+    """
+    Writes the generated settings as JSON with an atomic rename, only when their content changed.
+    Returns True when the file has been written.
+    """
+    content = json.dumps(generated_settings, sort_keys=True, separators=(',', ':'), default=unicode)
+    content_hash = hashlib.sha1(content).hexdigest()
+    path = generatedSettingsPath()
+    try:
+        with open(path) as f:
+            if json.load(f).get('hash') == content_hash:
+                return False
+    except (IOError, ValueError):
+        pass
+    fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.generated_settings', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps({
+                'hash': content_hash,
+                'generated_date': time.time(),
+                'settings': json.loads(content),
+            }, separators=(',', ':')))
+        os.chmod(temporary_path, 0644)
+        os.rename(temporary_path, path)
+    except:
+        os.remove(temporary_path)
+        raise
+    return True
 
 class Command(BaseCommand):
     can_import_settings = True
+    args = '[later]'
 
     def handle(self, *args, **options):
+        if 'later' in args:
+            from majilove.jobs import enqueue
+            enqueue('generate_settings', key='generate_settings')
+            print 'Enqueued'
+            return
         generate_settings()
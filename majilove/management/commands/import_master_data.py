@@ -0,0 +1,203 @@
+import csv, json
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from magi.models import User
+from majilove import models
+from majilove.facets import invalidate as invalidateFacets
+from majilove.jobs import enqueue
+from majilove.search import indexItems
+
+MODELS = {
+    'idol': (models.Idol, 'name'),
+    'photo': (models.Photo, 'id'),
+}
+
+def readRows(path):
+    """
+    Yields (line number, row) from a CSV file or a JSON lines file (one object per line).
+    Each row has a type (idol or photo) and the values of the fields of the model.
+    """
+    with open(path) as f:
+        if path.endswith('.csv'):
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                yield line_number, {
+                    key.decode('utf-8'): (value.decode('utf-8') if value != '' else None)
+                    for key, value in row.items()
+                }
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield line_number, json.loads(line)
+
+def _choiceNames(model, field_name):
+    return [
+        choice[0] if isinstance(choice, tuple) else choice
+        for choice in getattr(model, u'{}_CHOICES'.format(field_name.upper()))
+    ]
+
+def rowToFields(model, row, idols_ids):
+    fields = {}
+    attnames = { field.attname: field for field in model._meta.fields }
+    for key, value in row.items():
+        if key == 'type':
+            continue
+        if key.startswith('d_') and isinstance(value, dict):
+            value = json.dumps(value)
+        if model is models.Photo and key == 'idol':
+            if value not in idols_ids:
+                raise ValueError(u'Unknown idol {}'.format(value))
+            key, value = 'idol_id', idols_ids[value]
+        elif key not in attnames and u'i_{}'.format(key) in attnames and value is not None:
+            choices = _choiceNames(model, key)
+            if value not in choices:
+                raise ValueError(u'Invalid {}: {}'.format(key, value))
+            key, value = u'i_{}'.format(key), choices.index(value)
+        if key not in attnames:
+            raise ValueError(u'Unknown field {}'.format(key))
+        fields[key] = value
+    return fields
+
+class Importer(object):
+    def __init__(self, owner, chunk_size=500):
+        self.owner = owner
+        self.chunk_size = chunk_size
+        self.created = { name: 0 for name in MODELS.keys() }
+        self.updated = { name: 0 for name in MODELS.keys() }
+        self.errors = []
+        self.loadIdols()
+
+    def loadIdols(self):
+        self.idols = models.Idol.objects.in_bulk(models.Idol.objects.values_list('id', flat=True))
+        self.idols_ids = { idol.name: idol.id for idol in self.idols.values() }
+
+    def importFile(self, path):
+        rows = readRows(path)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            by_type = { name: [] for name in MODELS.keys() }
+            for line_number, row in chunk:
+                if row.get('type') not in MODELS:
+                    self.errors.append((line_number, u'Unknown type {}'.format(row.get('type'))))
+                    continue
+                by_type[row['type']].append((line_number, row))
+            # Idols first so photos can reference them
+            self.importChunk('idol', by_type['idol'])
+            self.importChunk('photo', by_type['photo'])
+
+    def importChunk(self, name, rows):
+        if not rows:
+            return
+        model, key_field = MODELS[name]
+        valid_rows = []
+        seen_keys = set()
+        for line_number, row in rows:
+            try:
+                fields = rowToFields(model, row, self.idols_ids)
+                if fields.get(key_field) is None:
+                    raise ValueError(u'Missing {}'.format(key_field))
+                instance = model(owner=self.owner, **fields)
+                instance.clean_fields(exclude=[
+                    field.name for field in model._meta.fields
+                    if field.attname not in fields
+                ])
+                if getattr(instance, key_field) in seen_keys:
+                    raise ValueError(u'Duplicate {} {}'.format(key_field, getattr(instance, key_field)))
+            except (ValueError, TypeError, ValidationError), e:
+                self.errors.append((line_number, unicode(e)))
+                continue
+            seen_keys.add(getattr(instance, key_field))
+            valid_rows.append((line_number, fields, instance))
+
+        keys = [getattr(_instance, key_field) for _line_number, _fields, _instance in valid_rows]
+        existing = model.objects.in_bulk(keys) if key_field == 'id' else {
+            getattr(item, key_field): item for item in model.objects.filter(**{ u'{}__in'.format(key_field): keys })
+        }
+        # Caches are computed before writing anything, so an error only skips its own row
+        to_create = []
+        to_update = []
+        for line_number, fields, instance in valid_rows:
+            item = existing.get(getattr(instance, key_field), None)
+            try:
+                if item is None:
+                    if model is models.Photo:
+                        instance.idol = self.idols[instance.idol_id]
+                        instance.update_caches()
+                    to_create.append(instance)
+                    continue
+                previous_level_curve = getattr(item, '_cache_level_curve', None)
+                for field_name in fields.keys():
+                    setattr(item, field_name, getattr(instance, field_name))
+                if model is models.Photo:
+                    item.idol = self.idols[item.idol_id]
+                    item.update_caches()
+            except (ValueError, TypeError, ValidationError), e:
+                self.errors.append((line_number, unicode(e)))
+                continue
+            to_update.append((fields, item, previous_level_curve))
+        updated_idols = []
+        changed_curve_photos = []
+        with transaction.atomic():
+            for fields, item, previous_level_curve in to_update:
+                update = { field_name: getattr(item, field_name) for field_name in fields.keys() }
+                if model is models.Photo:
+                    update.update({ field_name: getattr(item, field_name) for field_name in models.Photo.CACHE_FIELDS })
+                    update['_cache_version'] = F('_cache_version') + 1
+                    if previous_level_curve != item._cache_level_curve:
+                        changed_curve_photos.append(item.id)
+                else:
+                    updated_idols.append(item)
+                model.objects.filter(pk=item.pk).update(**update)
+                self.updated[name] += 1
+            model.objects.bulk_create(to_create)
+            self.created[name] += len(to_create)
+            for idol in updated_idols:
+                models.Photo.update_cache_idol_for_idol(idol)
+        if changed_curve_photos:
+            models.CollectiblePhoto.update_cache_stats_for_queryset(
+                models.CollectiblePhoto.objects.filter(photo_id__in=changed_curve_photos))
+        # .update() and bulk_create don't send the signals that index the items and invalidate the facets
+        indexItems(name, model.objects.filter(**{ u'{}__in'.format(key_field): keys }))
+        if model is models.Idol:
+            self.loadIdols()
+            if updated_idols:
+                # Photos are indexed with the names of their idol
+                indexItems('photo', models.Photo.objects.filter(idol_id__in=[idol.id for idol in updated_idols]))
+        else:
+            invalidateFacets()
+            if to_create:
+                enqueue('update_collection_completions', key='collection_completions')
+
+def import_master_data(path, owner, chunk_size=500):
+    importer = Importer(owner, chunk_size=chunk_size)
+    importer.importFile(path)
+    for name in MODELS.keys():
+        print u'{}: {} created, {} updated'.format(name, importer.created[name], importer.updated[name])
+    print len(importer.errors), 'errors'
+    for line_number, error in importer.errors:
+        print u'Line {}: {}'.format(line_number, error).encode('utf-8')
+    if importer.created['photo']:
+        print 'Run generate_image_derivatives to generate the images of the new photos'
+    return importer
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '<file.csv|file.jsonl> [owner username] [chunk_size]'
+    help = 'Creates or updates idols (by name) and photos (by id) from a CSV or JSON lines dump, idols first.'
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('Missing file')
+        try:
+            owner = User.objects.get(username=args[1]) if len(args) > 1 else User.objects.filter(is_superuser=True).order_by('id')[0]
+        except (User.DoesNotExist, IndexError):
+            raise CommandError('Owner not found')
+        try:
+            chunk_size = int(args[2]) if len(args) > 2 else 500
+        except ValueError:
+            raise CommandError('chunk_size must be a number')
+        import_master_data(args[0], owner, chunk_size=chunk_size)
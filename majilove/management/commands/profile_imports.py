@@ -0,0 +1,45 @@
+import json, os, subprocess, sys
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings as django_settings
+
+# Imported after django.setup() when no module is given, like a request or a command would
+DEFAULT_MODULES = ['majilove.settings', 'majilove.models', 'majilove.magicollections', 'majilove.views']
+
+TOP = 30
+
+def profile_imports(modules):
+    """
+    Imports modules in a new interpreter and returns [(module, cumulative seconds, self seconds)].
+    """
+    environment = dict(os.environ)
+    environment['DJANGO_SETTINGS_MODULE'] = os.environ.get('DJANGO_SETTINGS_MODULE', django_settings.SETTINGS_MODULE)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'majilove.importprofiler'] + modules,
+        cwd=django_settings.BASE_DIR, env=environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    output, errors = process.communicate()
+    if process.returncode:
+        raise CommandError(errors)
+    return [tuple(record) for record in json.loads(output)]
+
+def printProfile(records, top=TOP):
+    total = sum(self_time for _module, _cumulative, self_time in records)
+    print 'Total import time: {:.3f}s, {} modules'.format(total, len(records))
+    print '{:>10} {:>10}  {}'.format('cumulative', 'self', 'module')
+    for module, cumulative, self_time in sorted(records, key=lambda record: -record[1])[:top]:
+        print '{:>9.1f}ms {:>8.1f}ms  {}'.format(cumulative * 1000, self_time * 1000, module)
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '[module ...] [output.json]'
+    help = 'Reports the cumulative import time of each module when starting a new process.'
+
+    def handle(self, *args, **options):
+        output = [arg for arg in args if arg.endswith('.json')]
+        modules = [arg for arg in args if not arg.endswith('.json')] or DEFAULT_MODULES
+        records = profile_imports(modules)
+        printProfile(records)
+        if output:
+            with open(output[0], 'w') as f:
+                json.dump({ 'modules': modules, 'imports': records }, f, indent=2)
+            print 'Saved in', output[0]
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+from majilove.collectionsummary import rebuildSummaries
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '[chunk_size]'
+
+    def handle(self, *args, **options):
+        try:
+            chunk_size = int(args[0]) if args else 1000
+        except ValueError:
+            raise CommandError('chunk_size must be a number')
+        print 'Rebuilt', rebuildSummaries(chunk_size=chunk_size), 'account collection summaries'
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from majilove import models
+
+def rebuild_idols_cache(chunk_size=20):
+    idols = list(models.Idol.objects.all().order_by('id'))
+    print 'Rebuild cached idol of photos for', len(idols), 'idols'
+    total = 0
+    for start in range(0, len(idols), chunk_size):
+        with transaction.atomic():
+            for idol in idols[start:start + chunk_size]:
+                total += models.Photo.update_cache_idol_for_idol(idol)
+    print 'Updated', total, 'photos'
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '[chunk_size]'
+
+    def handle(self, *args, **options):
+        try:
+            chunk_size = int(args[0]) if args else 20
+        except ValueError:
+            raise CommandError('chunk_size must be a number')
+        rebuild_idols_cache(chunk_size=chunk_size)
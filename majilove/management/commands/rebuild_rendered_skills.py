@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from majilove import models
+
+def rebuild_rendered_skills(chunk_size=100):
+    photo_ids = list(models.Photo.objects.all().order_by('id').values_list('id', flat=True))
+    print 'Render skills of', len(photo_ids), 'photos in all languages'
+    for start in range(0, len(photo_ids), chunk_size):
+        with transaction.atomic():
+            for photo in models.Photo.objects.filter(id__in=photo_ids[start:start + chunk_size]):
+                photo.update_cache_rendered_skills()
+                models.Photo.objects.filter(pk=photo.pk).update(_cache_rendered_skills=photo._cache_rendered_skills)
+    print 'Done'
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '[chunk_size]'
+
+    def handle(self, *args, **options):
+        try:
+            chunk_size = int(args[0]) if args else 100
+        except ValueError:
+            raise CommandError('chunk_size must be a number')
+        rebuild_rendered_skills(chunk_size=chunk_size)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+from majilove.search import COLLECTIONS, rebuildIndex
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '[collection ...]'
+    help = 'Rebuilds the search index of idols and photos, or of the given collections.'
+
+    def handle(self, *args, **options):
+        for collection in (args or sorted(COLLECTIONS.keys())):
+            if collection not in COLLECTIONS:
+                raise CommandError(u'Unknown collection {}'.format(collection))
+            print 'Indexed', rebuildIndex(collection), collection + 's'
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+import datetime, json, os, random, shutil, tempfile, time
+from contextlib import contextmanager
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings as django_settings
+from django.db import connection, transaction
+from django.utils import translation
+from magi.models import User
+from magi.utils import getMagiCollection
+from majilove import models, simulator
+
+SYNTHETIC_COUNTS = {
+    'idols': 200,
+    'photos': 20000,
+    'accounts': 50000,
+    'collectiblephotos': 3000000,
+}
+
+SYNTHETIC_PREFIX = u'Benchmark'
+
+CHUNK_SIZE = 10000
+
+############################################################
+# Synthetic data
+
+def _bulkCreate(model, objects):
+    with transaction.atomic():
+        model.objects.bulk_create(objects)
+
+def populate(scale=1.):
+    """
+    Fills the database with synthetic idols, photos, accounts and collectible photos.
+    bulk_create doesn't call save, so the caches are computed here the same way save would.
+    """
+    counts = { key: max(int(count * scale), 1) for key, count in SYNTHETIC_COUNTS.items() }
+    user = User.objects.create(username='benchmark', email='benchmark@example.com')
+    random.seed(0)
+
+    print 'Create', counts['idols'], 'idols'
+    _bulkCreate(models.Idol, [models.Idol(
+        owner=user,
+        name=u'{} Idol {}'.format(SYNTHETIC_PREFIX, i),
+        japanese_name=u'{} アイドル {}'.format(SYNTHETIC_PREFIX, i),
+        d_names=json.dumps({ 'ru': u'Идол {}'.format(i) }),
+        small_image=u'idol/small/{}.png'.format(i),
+    ) for i in range(counts['idols'])])
+    idols = list(models.Idol.objects.all())
+
+    print 'Create', counts['photos'], 'photos'
+    photos = []
+    for start in range(0, counts['photos'], CHUNK_SIZE):
+        chunk = [models.Photo(
+            id=i + 1,
+            owner=user,
+            name=u'{} Photo {}'.format(SYNTHETIC_PREFIX, i),
+            idol=random.choice(idols),
+            release_date=datetime.date(2017, 1, 1) + datetime.timedelta(days=i % 1000),
+            full_photo=u'photo/image/{}.png'.format(i),
+            i_rarity=random.randrange(len(models.Photo.RARITY_CHOICES)),
+            i_color=random.randrange(len(models.Photo.COLOR_CHOICES)),
+            dance_min=random.randrange(500, 1000), dance_single_copy_max=random.randrange(2000, 3000), dance_max_copy_max=random.randrange(3000, 4000),
+            vocal_min=random.randrange(500, 1000), vocal_single_copy_max=random.randrange(2000, 3000), vocal_max_copy_max=random.randrange(3000, 4000),
+            charm_min=random.randrange(500, 1000), charm_single_copy_max=random.randrange(2000, 3000), charm_max_copy_max=random.randrange(3000, 4000),
+            i_skill_type=random.randrange(len(models.Photo.SKILL_TYPE_CHOICES)),
+            skill_note_count=random.randrange(1, 10),
+            skill_percentage=random.choice([7.5, 12.5, 30]),
+            i_leader_skill_stat=random.randrange(len(models.Photo.LEADER_SKILL_STAT_CHOICES)),
+            leader_skill_percentage=random.choice([10, 20, 30]),
+            i_sub_skill_type=random.randrange(len(models.Photo.SUB_SKILL_TYPE_CHOICES)),
+            sub_skill_amount=2000,
+            sub_skill_percentage=80,
+        ) for i in range(start, min(start + CHUNK_SIZE, counts['photos']))]
+        for photo in chunk:
+            photo.update_caches()
+        _bulkCreate(models.Photo, chunk)
+        photos += chunk
+    photo_ids = [photo.id for photo in photos]
+
+    print 'Create', counts['accounts'], 'accounts'
+    _bulkCreate(models.Account, [models.Account(
+        owner=user,
+        nickname=u'{} {}'.format(SYNTHETIC_PREFIX, i),
+        level=random.randrange(1, 300),
+    ) for i in range(counts['accounts'])])
+    account_ids = list(models.Account.objects.values_list('id', flat=True))
+
+    print 'Create', counts['collectiblephotos'], 'collectible photos'
+    for start in range(0, counts['collectiblephotos'], CHUNK_SIZE):
+        chunk = []
+        for i in range(start, min(start + CHUNK_SIZE, counts['collectiblephotos'])):
+            photo = random.choice(photos)
+            chunk.append(models.CollectiblePhoto(
+                account_id=account_ids[i % len(account_ids)],
+                photo_id=photo.id,
+                level=random.randrange(1, photo.max_max_level + 1),
+                moments_unlocked=random.choice([0, 50, 100]),
+                bonus_moment_squares_unlocked=random.randrange(0, 16),
+            ))
+        _bulkCreate(models.CollectiblePhoto, chunk)
+    print 'Compute the stats of the collectible photos'
+    models.CollectiblePhoto.update_cache_stats_for_queryset(models.CollectiblePhoto.objects.all(), chunk_size=CHUNK_SIZE, update_summaries=False)
+    return account_ids, photo_ids
+
+@contextmanager
+def temporaryDatabase():
+    """
+    Runs the benchmarks in a new database, destroyed afterwards, like the test runner does.
+    SQLite databases are in a temporary file instead of in memory to fit millions of rows.
+    """
+    directory = None
+    old_name, old_test_name = connection.settings_dict['NAME'], connection.settings_dict['TEST']['NAME']
+    if connection.vendor == 'sqlite':
+        directory = tempfile.mkdtemp()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        try:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            # destroy_test_db doesn't switch back to the database
+            connection.settings_dict['NAME'] = django_settings.DATABASES[connection.alias]['NAME'] = old_name
+            connection.settings_dict['TEST']['NAME'] = old_test_name
+            if directory:
+                shutil.rmtree(directory)
+
+############################################################
+# Benchmarks
+
+def _timed(function, iterations=1):
+    queries_before = len(connection.queries)
+    start = time.time()
+    for _i in range(iterations):
+        function()
+    seconds = time.time() - start
+    return {
+        'iterations': iterations,
+        'seconds': seconds,
+        'seconds_per_iteration': seconds / iterations,
+        'queries': (len(connection.queries) - queries_before) if django_settings.DEBUG else None,
+    }
+
+def benchmarks(account_ids, photo_ids):
+    account_id = account_ids[0]
+    cards = list(models.CollectiblePhoto.objects.filter(account_id__in=account_ids[:100]).select_related('photo'))
+    photos = list(models.Photo.objects.filter(id__in=photo_ids[:2000]))
+    photo_collection = getMagiCollection('photo')
+
+    def stat_properties():
+        for card in cards:
+            card.total_stats
+
+    def bulk_stats():
+        models.CollectiblePhoto.bulk_display_stats(models.CollectiblePhoto.objects.filter(account_id__in=account_ids[:100]))
+
+    def compute_skills():
+        for photo in photos:
+            photo.compute_skill()
+            photo.compute_sub_skill()
+            photo.compute_leader_skill()
+
+    def rendered_skills():
+        for photo in photos:
+            photo.skill
+            photo.sub_skill
+            photo.leader_skill
+
+    def item_to_fields():
+        for photo in photos[:200]:
+            photo_collection.item_view.to_fields(photo)
+
+    def photo_list():
+        list(models.Photo.objects.all().order_by('-release_date', '-id')[:50])
+
+    def photo_list_filtered():
+        list(models.Photo.objects.filter(i_rarity=3, i_color=1).order_by('-release_date', '-id')[:50])
+
+    def photo_list_deep():
+        list(models.Photo.objects.all().order_by('-release_date', '-id')[len(photo_ids) // 2:len(photo_ids) // 2 + 50])
+
+    def collection_list():
+        list(models.CollectiblePhoto.objects.filter(account_id=account_id).select_related('photo')[:50])
+
+    def strongest_cards():
+        list(models.CollectiblePhoto.strongest(account_id, limit=50))
+
+    def idol_cache_refresh():
+        models.Photo.update_cache_idol_for_idol(models.Idol.objects.get(id=photos[0].idol_id))
+
+    def stats_cache_refresh():
+        models.CollectiblePhoto.update_cache_stats_for_queryset(models.CollectiblePhoto.objects.filter(account_id__in=account_ids[:100]), update_summaries=False)
+
+    team = simulator.teamSpec(cards[:5])
+    def simulate_live():
+        simulator.simulate(team, runs=10000, seed=0)
+
+    results = {}
+    for name, function, iterations in [
+            ('stat_properties', stat_properties, 1),
+            ('bulk_display_stats', bulk_stats, 1),
+            ('compute_skills', compute_skills, 1),
+            ('rendered_skills', rendered_skills, 1),
+            ('item_view_to_fields', item_to_fields, 1),
+            ('photo_list', photo_list, 20),
+            ('photo_list_filtered', photo_list_filtered, 20),
+            ('photo_list_deep_page', photo_list_deep, 20),
+            ('collection_list', collection_list, 20),
+            ('strongest_cards', strongest_cards, 20),
+            ('idol_cache_refresh', idol_cache_refresh, 5),
+            ('stats_cache_refresh', stats_cache_refresh, 1),
+            ('simulate_live_10000_runs', simulate_live, 5),
+    ]:
+        print 'Run', name
+        results[name] = _timed(function, iterations=iterations)
+    return results
+
+def run_benchmarks(scale=1., output=None):
+    translation.activate('en')
+    with temporaryDatabase():
+        account_ids, photo_ids = populate(scale=scale)
+        report = {
+            'date': datetime.datetime.utcnow().isoformat(),
+            'scale': scale,
+            'counts': {
+                'idols': models.Idol.objects.count(),
+                'photos': models.Photo.objects.count(),
+                'accounts': models.Account.objects.count(),
+                'collectiblephotos': models.CollectiblePhoto.objects.count(),
+            },
+            'results': benchmarks(account_ids, photo_ids),
+        }
+    content = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(content)
+        print 'Saved', output
+    else:
+        print content
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '[scale] [output.json]'
+
+    def handle(self, *args, **options):
+        try:
+            scale = float(args[0]) if args else 1.
+        except ValueError:
+            raise CommandError('scale must be a number')
+        run_benchmarks(scale=scale, output=args[1] if len(args) > 1 else None)
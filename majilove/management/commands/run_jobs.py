@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from majilove import models
+from majilove.jobs import runWorkers, PENDING, RUNNING, FAILED
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '[concurrency] [once]'
+    help = 'Runs the queued jobs with concurrency worker threads, until interrupted or, with once, until the queue is empty.'
+
+    def handle(self, *args, **options):
+        try:
+            concurrency = int(args[0]) if args and args[0] != 'once' else 1
+        except ValueError:
+            raise CommandError('concurrency must be a number')
+        if concurrency < 1:
+            raise CommandError('concurrency must be at least 1')
+        print 'Pending: {}, running: {}, failed: {}'.format(*[
+            models.Job.objects.filter(i_status=status).count() for status in [PENDING, RUNNING, FAILED]
+        ])
+        runWorkers(concurrency=concurrency, once='once' in args)
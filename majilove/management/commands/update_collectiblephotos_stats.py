@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from majilove import models
+from majilove.collectionsummary import rebuildSummaries
+
+def update_collectiblephotos_stats(chunk_size=1000):
+    print 'Update cached stats of collectible photos'
+    total = models.CollectiblePhoto.update_cache_stats_for_queryset(models.CollectiblePhoto.objects.all(), chunk_size=chunk_size, update_summaries=False)
+    print 'Updated', total, 'collectible photos'
+    # One pass over all the collectible photos instead of a job per account
+    print 'Rebuilt', rebuildSummaries(), 'account collection summaries'
+
+class Command(BaseCommand):
+    can_import_settings = True
+    args = '[chunk_size]'
+
+    def handle(self, *args, **options):
+        try:
+            chunk_size = int(args[0]) if args else 1000
+        except ValueError:
+            raise CommandError('chunk_size must be a number')
+        update_collectiblephotos_stats(chunk_size=chunk_size)
@@ -0,0 +1,178 @@
+import json, logging, os, tempfile, threading, time
+from collections import Counter, deque
+from django.conf import settings as django_settings
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+# Warn when a request runs more queries than that
+QUERY_BUDGET = getattr(django_settings, 'COLLECTION_STATS_QUERY_BUDGET', 50)
+# Number of requests kept per view
+HISTORY_SIZE = getattr(django_settings, 'COLLECTION_STATS_HISTORY_SIZE', 1000)
+# Each process dumps its stats there every DUMP_EVERY requests, for the dump_collection_stats command
+DIRECTORY = getattr(django_settings, 'COLLECTION_STATS_DIRECTORY', os.path.join(tempfile.gettempdir(), 'majilove_collection_stats'))
+DUMP_EVERY = getattr(django_settings, 'COLLECTION_STATS_DUMP_EVERY', 100)
+
+METRICS = ['queries', 'duplicated_queries', 'sql_time', 'template_time', 'total_time']
+
+_stats = {}
+_stats_lock = threading.Lock()
+_requests_count = [0]
+_local = threading.local()
+
+############################################################
+# Template time
+
+def _timedTemplateRender(self, context):
+    depth = getattr(_local, 'template_depth', 0)
+    _local.template_depth = depth + 1
+    start = time.time()
+    try:
+        return _originalTemplateRender(self, context)
+    finally:
+        _local.template_depth = depth
+        # Only count the outermost template, included templates are part of it
+        if depth == 0:
+            _local.template_time = getattr(_local, 'template_time', 0) + time.time() - start
+
+_originalTemplateRender = Template.render
+# Template.render is only replaced while requests are recorded
+_template_timing_lock = threading.Lock()
+_template_timing_requests = [0]
+
+def startTemplateTiming():
+    with _template_timing_lock:
+        if _template_timing_requests[0] == 0:
+            Template.render = _timedTemplateRender
+        _template_timing_requests[0] += 1
+    _local.template_time = 0
+
+def stopTemplateTiming():
+    """
+    Returns the template time of the current thread since startTemplateTiming.
+    """
+    with _template_timing_lock:
+        _template_timing_requests[0] -= 1
+        if _template_timing_requests[0] == 0:
+            Template.render = _originalTemplateRender
+    return getattr(_local, 'template_time', 0)
+
+############################################################
+# Stats
+
+def viewKey(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    if match.url_name:
+        return match.url_name
+    return u'{}.{}'.format(match.func.__module__, match.func.__name__)
+
+def record(key, sample):
+    with _stats_lock:
+        _stats.setdefault(key, deque(maxlen=HISTORY_SIZE)).append(sample)
+        _requests_count[0] += 1
+        should_dump = DUMP_EVERY and _requests_count[0] % DUMP_EVERY == 0
+    if should_dump:
+        dump()
+
+def samples():
+    with _stats_lock:
+        return { key: list(history) for key, history in _stats.items() }
+
+def _percentile(values, percentile):
+    return values[min(int(len(values) * percentile / 100.), len(values) - 1)]
+
+def summarize(all_samples):
+    """
+    {view: {count, metric: {mean, p50, p95, max}}} from {view: [samples]}
+    """
+    summary = {}
+    for key, view_samples in all_samples.items():
+        summary[key] = { 'count': len(view_samples) }
+        for metric in METRICS:
+            values = sorted(sample[metric] for sample in view_samples)
+            summary[key][metric] = {
+                'mean': sum(values) / float(len(values)),
+                'p50': _percentile(values, 50),
+                'p95': _percentile(values, 95),
+                'max': values[-1],
+            }
+    return summary
+
+def dump():
+    """
+    Saves the samples of this process in DIRECTORY, with an atomic rename.
+    """
+    if not os.path.isdir(DIRECTORY):
+        os.makedirs(DIRECTORY)
+    path = os.path.join(DIRECTORY, u'{}.json'.format(os.getpid()))
+    fd, temporary_path = tempfile.mkstemp(dir=DIRECTORY, prefix='.')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(samples(), f)
+    os.rename(temporary_path, path)
+
+def loadDumps():
+    """
+    Merged samples of all the processes that dumped their stats.
+    """
+    all_samples = {}
+    if not os.path.isdir(DIRECTORY):
+        return all_samples
+    for file_name in os.listdir(DIRECTORY):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(DIRECTORY, file_name)) as f:
+                for key, view_samples in json.load(f).items():
+                    all_samples.setdefault(key, []).extend(view_samples)
+        except (IOError, ValueError):
+            continue
+    return all_samples
+
+############################################################
+# Middleware
+
+class CollectionStatsMiddleware(object):
+    """
+    Records the number of queries, duplicated queries, SQL time, template time and total time
+    of each view (keyed by URL name), in bounded in-memory histories.
+    Queries are counted on all the databases, including the read replicas.
+    """
+    def process_request(self, request):
+        request._collection_stats_start = time.time()
+        # {alias: (use_debug_cursor before the request, index of the first query of the request)}
+        request._collection_stats_connections = {}
+        for connection in connections.all():
+            request._collection_stats_connections[connection.alias] = (connection.use_debug_cursor, len(connection.queries))
+            connection.use_debug_cursor = True
+        startTemplateTiming()
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_collection_stats_start'):
+            return response
+        total_time = time.time() - request._collection_stats_start
+        template_time = stopTemplateTiming()
+        queries = []
+        for alias, (use_debug_cursor, first_query) in request._collection_stats_connections.items():
+            connection = connections[alias]
+            connection.use_debug_cursor = use_debug_cursor
+            queries += connection.queries[first_query:]
+        del request._collection_stats_start
+        key = viewKey(request)
+        if key is None:
+            return response
+        sql_counts = Counter(query['sql'] for query in queries)
+        sample = {
+            'queries': len(queries),
+            'duplicated_queries': sum(count - 1 for count in sql_counts.values()),
+            'sql_time': sum(float(query['time']) for query in queries),
+            'template_time': template_time,
+            'total_time': total_time,
+        }
+        record(key, sample)
+        if QUERY_BUDGET and sample['queries'] > QUERY_BUDGET:
+            logger.warning(u'{} {} ran {} queries ({} duplicated), over the budget of {}'.format(
+                key, request.path, sample['queries'], sample['duplicated_queries'], QUERY_BUDGET))
+        return response
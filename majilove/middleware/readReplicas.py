@@ -0,0 +1,29 @@
+import time
+from django.conf import settings as django_settings
+from majilove import dbrouter
+
+# Users read from the primary for that many seconds after they wrote, so they see their changes
+# even when the replicas lag behind
+READ_YOUR_WRITES_SECONDS = getattr(django_settings, 'READ_YOUR_WRITES_SECONDS', 10)
+COOKIE_NAME = 'majilove_primary_until'
+
+SAFE_METHODS = ['GET', 'HEAD', 'OPTIONS']
+
+def _pinnedToPrimary(request):
+    try:
+        return float(request.COOKIES.get(COOKIE_NAME, 0)) > time.time()
+    except ValueError:
+        return False
+
+class ReadReplicasMiddleware(object):
+    """
+    Enables majilove.dbrouter.ReadReplicaRouter for safe requests of users who didn't write recently.
+    """
+    def process_request(self, request):
+        dbrouter.useReplicas(request.method in SAFE_METHODS and not _pinnedToPrimary(request))
+
+    def process_response(self, request, response):
+        if dbrouter.wrote():
+            response.set_cookie(COOKIE_NAME, str(time.time() + READ_YOUR_WRITES_SECONDS), max_age=READ_YOUR_WRITES_SECONDS)
+        dbrouter.useReplicas(False)
+        return response
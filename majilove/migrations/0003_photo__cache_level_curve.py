@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('majilove', '0002_idol_photo_collectiblephoto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='_cache_level_curve',
+            field=models.TextField(null=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('majilove', '0003_photo__cache_level_curve'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collectiblephoto',
+            name='_cache_stats_charm',
+            field=models.FloatField(null=True, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='collectiblephoto',
+            name='_cache_stats_dance',
+            field=models.FloatField(null=True, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='collectiblephoto',
+            name='_cache_stats_last_update',
+            field=models.DateTimeField(null=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='collectiblephoto',
+            name='_cache_stats_total',
+            field=models.FloatField(null=True, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='collectiblephoto',
+            name='_cache_stats_vocal',
+            field=models.FloatField(null=True, db_index=True),
+            preserve_default=True,
+        ),
+    ]
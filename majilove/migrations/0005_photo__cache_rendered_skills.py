@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('majilove', '0004_collectiblephoto_cache_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='_cache_rendered_skills',
+            field=models.TextField(null=True),
+            preserve_default=True,
+        ),
+    ]
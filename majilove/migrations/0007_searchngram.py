@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('majilove', '0006_photo__cache_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchNgram',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('collection', models.CharField(max_length=20)),
+                ('item_id', models.PositiveIntegerField()),
+                ('ngram', models.CharField(max_length=2)),
+                ('weight', models.PositiveIntegerField(default=1)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchngram',
+            unique_together=set([('collection', 'item_id', 'ngram')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='searchngram',
+            index_together=set([('collection', 'ngram')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('majilove', '0007_searchngram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='_cache_version',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('majilove', '0008_photo__cache_version'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='account',
+            index_together=set([('level', 'id')]),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('majilove', '0009_account_level_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountCollectionSummary',
+            fields=[
+                ('account', models.OneToOneField(related_name='collection_summary', primary_key=True, serialize=False, to='majilove.Account')),
+                ('last_update', models.DateTimeField(null=True)),
+                ('total_photos', models.PositiveIntegerField(default=0)),
+                ('unique_photos', models.PositiveIntegerField(default=0)),
+                ('completion_percentage', models.FloatField(default=0, db_index=True)),
+                ('team_power', models.FloatField(default=0, db_index=True)),
+                ('n_photos', models.PositiveIntegerField(default=0)),
+                ('r_photos', models.PositiveIntegerField(default=0)),
+                ('sr_photos', models.PositiveIntegerField(default=0)),
+                ('ur_photos', models.PositiveIntegerField(default=0)),
+                ('star_photos', models.PositiveIntegerField(default=0)),
+                ('shine_photos', models.PositiveIntegerField(default=0)),
+                ('dream_photos', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('majilove', '0010_accountcollectionsummary'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='photo',
+            index_together=set([('i_rarity', 'i_color', 'release_date'), ('i_skill_type', 'i_rarity', 'release_date'), ('i_color', 'release_date'), ('idol', 'i_rarity', 'release_date')]),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('majilove', '0011_photo_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=100)),
+                ('arguments', models.TextField(default=b'{}')),
+                ('key', models.CharField(max_length=200, null=True, db_index=True)),
+                ('priority', models.IntegerField(default=0)),
+                ('i_status', models.PositiveIntegerField(default=0, choices=[(0, b'pending'), (1, b'running'), (2, b'failed')])),
+                ('run_after', models.DateTimeField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=5)),
+                ('worker', models.CharField(max_length=100, null=True)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('last_error', models.TextField(null=True)),
+                ('creation', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='job',
+            index_together=set([('i_status', 'priority', 'run_after')]),
+        ),
+    ]
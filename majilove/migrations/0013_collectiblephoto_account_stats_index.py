@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('majilove', '0012_job'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='collectiblephoto',
+            index_together=set([('account', '_cache_stats_total')]),
+        ),
+    ]
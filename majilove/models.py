@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
+import json
+import numpy as np
 from collections import OrderedDict
+from string import Formatter
 from math import ceil
 from django.utils.translation import ugettext_lazy as _, string_concat, get_language
-from django.db import models
+from django.db import models, transaction, connections, router
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.conf import settings as django_settings
+from django.utils import timezone, translation
 from magi.models import User, uploadItem
 from magi.item_model import MagiModel, i_choices, getInfoFromChoices
 from magi.abstract_models import AccountAsOwnerModel, BaseAccount
-from magi.utils import templateVariables
 
 
 ############################################################
@@ -16,11 +21,97 @@ from magi.utils import templateVariables
 LANGUAGES_NEED_OWN_NAME = [ l for l in django_settings.LANGUAGES if l[0] in ['ru', 'zh-hans', 'zh-hant', 'kr'] ]
 ALL_ALT_LANGUAGES = [ l for l in django_settings.LANGUAGES if l[0] != 'en' ]
 
+# All the compiled templates, see CompiledTemplate
+COMPILED_TEMPLATES = []
+
+_missing = object()
+
+class CompiledTemplate(object):
+    """
+    Template parsed once per language into a positional format string and the list of its variables,
+    to avoid calling templateVariables and building a dict of values on every access.
+    """
+    def __init__(self, template):
+        self.template = template
+        self.compiled = {}
+        COMPILED_TEMPLATES.append(self)
+
+    def compile(self, language=None):
+        language = language or get_language()
+        try:
+            return self.compiled[language]
+        except KeyError:
+            pass
+        with translation.override(language):
+            template = unicode(self.template)
+        variables, parts = [], []
+        for literal, variable, format_spec, conversion in Formatter().parse(template):
+            parts.append(literal.replace(u'{', u'{{').replace(u'}', u'}}'))
+            if variable is not None:
+                if variable not in variables:
+                    variables.append(variable)
+                parts.append(u'{{{}{}{}}}'.format(
+                    variables.index(variable),
+                    u'!' + conversion if conversion else u'',
+                    u':' + format_spec if format_spec else u'',
+                ))
+        self.compiled[language] = (u''.join(parts), variables)
+        return self.compiled[language]
+
+    def format(self, item, fallback_item=None, prefix=u'', language=None, required=False, **values):
+        """
+        Variables are taken from values, then item (prefixed with prefix), then fallback_item, or ''.
+        When required, returns None if one of them is None.
+        """
+        template, variables = self.compile(language=language)
+        arguments = []
+        for variable in variables:
+            value = values.get(variable, _missing)
+            if value is _missing:
+                value = getattr(item, prefix + variable, _missing)
+            if value is _missing:
+                value = getattr(fallback_item, variable, u'')
+            if value is None and required:
+                return None
+            arguments.append(value)
+        return template.format(*arguments)
+
+def compileTemplates(infos, keys=('template', 'japanese_template')):
+    """
+    Adds compiled_template and compiled_japanese_template to each info dict.
+    """
+    for info in infos:
+        for key in keys:
+            if key in info:
+                info[u'compiled_{}'.format(key)] = CompiledTemplate(info[key])
+
+def precompileTemplates(languages=None):
+    for template in COMPILED_TEMPLATES:
+        for language in (languages or [language for language, _verbose_name in django_settings.LANGUAGES]):
+            template.compile(language=language)
+
 
 
 class Account(BaseAccount):
+    # Kept up to date by the update_account_ranks job when levels change (see majilove.leaderboard), this is only a safety net
+    _cache_leaderboards_days = 200
+
+    def update_cache_leaderboards(self):
+        from majilove.leaderboard import rank
+        self._cache_leaderboards_last_update = timezone.now()
+        self._cache_leaderboard = rank(self.level)
+
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        previous_level = None if created else Account.objects.filter(pk=self.pk).values_list('level', flat=True).first()
+        result = super(Account, self).save(*args, **kwargs)
+        if created or previous_level != self.level:
+            from majilove.jobs import enqueue
+            enqueue('update_account_ranks', key='account_ranks')
+        return result
+
     class Meta:
-        pass
+        index_together = [('level', 'id')]
 
 ############################################################
 # Idols
@@ -108,6 +199,16 @@ class Idol(MagiModel):
 
     small_image = models.ImageField('Small image (for map)', upload_to=uploadItem('idol/small'))
 
+    def to_cache_for_photos(self):
+        names = self.names or {}
+        names['en'] = self.name
+        names['ja'] = self.japanese_name
+        return {
+            'id': self.id,
+            'names': names,
+            'image': unicode(self.image)
+        }
+
     def __unicode__(self):
         return unicode(self.t_name)
 
@@ -148,6 +249,20 @@ class Photo(MagiModel):
     message = models.ImageField(_('Message'), upload_to=uploadItem('photo/message'), null=True)
     autograph = models.ImageField(_('Autograph'), upload_to=uploadItem('photo/autograph'), null=True)
 
+    IMAGE_FIELDS = [
+        'image', 'image_special_shot', 'full_photo', 'full_photo_special_shot', 'transparent', 'transparent_special_shot',
+        'art', 'art_special_shot', 'message', 'autograph',
+    ]
+
+    # {image field: {width: path}}, generated in the background after save, see majilove.images
+    _cache_image_derivatives = models.TextField(null=True)
+
+    @property
+    def image_derivatives(self):
+        if getattr(self, '_image_derivatives', None) is None:
+            self._image_derivatives = json.loads(self._cache_image_derivatives) if self._cache_image_derivatives else {}
+        return self._image_derivatives
+
     message_text = models.TextField(string_concat(_('Message text'), ' (', _('Japanese') + ')'), max_length=500, null=True)
     message_translation = models.TextField(_('Message translation'), max_length=500, null=True)
     MESSAGE_TRANSLATIONS_CHOICES = ALL_ALT_LANGUAGES
@@ -261,11 +376,72 @@ class Photo(MagiModel):
     def overall_max_copy_max(self):
         return self.dance_max_copy_max + self.vocal_max_copy_max + self.charm_max_copy_max
 
+    # Level curves
+
+    # Flat [dance, vocal, charm, dance, vocal, charm, ...] for every level from 1 to max_max_level
+    _cache_level_curve = models.TextField(null=True)
+
+    def compute_level_stat(self, stat, level):
+        if level == 1: return getattr(self, u'{}_min'.format(stat))
+        if level == self.single_max_level: return getattr(self, u'{}_single_copy_max'.format(stat))
+        if level == self.max_max_level: return getattr(self, u'{}_max_copy_max'.format(stat))
+        if level < self.single_max_level:
+            return getattr(self, u'{}_min'.format(stat)) + ((level - 1) * getattr(self, u'{}_single_copy_increment'.format(stat)))
+        return getattr(self, u'{}_single_copy_max'.format(stat)) + ((level - self.single_max_level) * getattr(self, u'{}_combined_increment'.format(stat)))
+
+    def compute_level_curve_array(self):
+        """
+        Same values as compute_level_stat for every level and statistic, computed in one vectorized pass.
+        Returns a numpy array of shape (max_max_level, number of statistics).
+        """
+        single_max_level, max_max_level = self.single_max_level, self.max_max_level
+        levels = np.arange(1, max_max_level + 1)[:, np.newaxis]
+        stats = self.STATISTICS.keys()
+        minimums, single_copy_maxs, max_copy_maxs = [
+            np.array([getattr(self, u'{}_{}'.format(stat, field)) for stat in stats])
+            for field in ['min', 'single_copy_max', 'max_copy_max']
+        ]
+        curve = minimums + (levels - 1) * np.array([getattr(self, u'{}_single_copy_increment'.format(stat)) for stat in stats])
+        if max_max_level > single_max_level:
+            curve = np.where(levels < single_max_level, curve, single_copy_maxs + (levels - single_max_level) * np.array([
+                getattr(self, u'{}_combined_increment'.format(stat)) for stat in stats]))
+        # In reverse order of priority of compute_level_stat
+        curve[-1] = max_copy_maxs
+        curve[single_max_level - 1] = single_copy_maxs
+        curve[0] = minimums
+        return curve
+
+    def to_cache_level_curve(self):
+        return self.compute_level_curve_array().ravel().tolist()
+
+    def update_cache_level_curve(self):
+        self._level_curve = None
+        self._cache_level_curve = json.dumps(self.to_cache_level_curve(), separators=(',', ':'))
+
+    @property
+    def level_curve(self):
+        """
+        List of (dance, vocal, charm) for each level, index 0 being level 1.
+        Parsed once per instance from _cache_level_curve, which is rebuilt on save.
+        """
+        if getattr(self, '_level_curve', None) is None:
+            if not self._cache_level_curve:
+                self.update_cache_level_curve()
+            flat = json.loads(self._cache_level_curve)
+            self._level_curve = [tuple(flat[i:i + 3]) for i in range(0, len(flat), 3)]
+        return self._level_curve
+
+    def level_stat(self, stat, level):
+        if 1 <= level <= len(self.level_curve):
+            return self.level_curve[level - 1][self.STATISTICS.keys().index(stat)]
+        return self.compute_level_stat(stat, level)
+
     # Leader Skill
     LEADER_SKILL_INFO = {
         'template': _(u'{t_leader_skill_color} {t_leader_skill_stat} +{leader_skill_percentage}%'),
         'japanese_template': u'{t_leader_skill_color} の{t_leader_skill_stat}パフォーマンス{leader_skill_percentage}%上昇',
     }
+    compileTemplates([LEADER_SKILL_INFO])
 
     # Currently leader skill color is always the same as card color
     LEADER_SKILL_COLOR_CHOICES = COLOR_CHOICES
@@ -293,21 +469,13 @@ class Photo(MagiModel):
     i_leader_skill_stat = models.PositiveIntegerField('{t_leader_skill_stat}', choices=i_choices(LEADER_SKILL_STAT_CHOICES), null=True)
     leader_skill_percentage = models.PositiveIntegerField('{leader_skill_percentage}', null=True)
 
-    @property
-    def leader_skill(self):
+    def compute_leader_skill(self):
         if self.leader_skill_stat is None: return None
-        return self.LEADER_SKILL_INFO['template'].format(**{
-            k: getattr(self, k, '')
-            for k in templateVariables(self.LEADER_SKILL_INFO['template'])
-        })
+        return self.LEADER_SKILL_INFO['compiled_template'].format(self, required=True)
 
-    @property
-    def japanese_leader_skill(self):
+    def compute_japanese_leader_skill(self):
         if self.leader_skill_color is None: return None
-        return self.LEADER_SKILL_INFO['japanese_template'].format(**{
-            k: getattr(self, k, '')
-            for k in templateVariables(self.LEADER_SKILL_INFO['template'])
-        })
+        return self.LEADER_SKILL_INFO['compiled_japanese_template'].format(self, required=True)
 
     # Skills
     SKILL_TYPES = OrderedDict([
@@ -375,6 +543,8 @@ class Photo(MagiModel):
         }),
     ])
 
+    compileTemplates(SKILL_TYPES.values())
+
     SKILL_VARIABLES = ['skill_note_count', 'skill_percentage']
 
     SKILL_TYPE_CHOICES = [(_name, _info['translation']) for _name, _info in SKILL_TYPES.items()]
@@ -384,28 +554,22 @@ class Photo(MagiModel):
     skill_icon = property(getInfoFromChoices('skill_type', SKILL_TYPES, 'icon'))
     skill_template = property(getInfoFromChoices('skill_type', SKILL_TYPES, 'template'))
     japanese_skill_template = property(getInfoFromChoices('skill_type', SKILL_TYPES, 'japanese_template'))
+    skill_compiled_template = property(getInfoFromChoices('skill_type', SKILL_TYPES, 'compiled_template'))
+    japanese_skill_compiled_template = property(getInfoFromChoices('skill_type', SKILL_TYPES, 'compiled_japanese_template'))
     skill_increment = property(getInfoFromChoices('skill_type', SKILL_TYPES, 'increment'))
 
-    @property
-    def skill(self):
+    def compute_skill(self):
         if self.i_skill_type is None: return None
-        return self.skill_template.format(**{
-            k: getattr(self, k, '')
-            for k in templateVariables(self.skill_template)
-        })
+        return self.skill_compiled_template.format(self, required=True)
 
-    @property
-    def japanese_skill(self):
+    def compute_japanese_skill(self):
         if self.i_skill_type is None: return None
-        return self.japanese_skill_template.format(**{
-            k: getattr(self, k, '')
-            for k in templateVariables(self.japanese_skill_template)
-        })
+        return self.japanese_skill_compiled_template.format(self, required=True)
 
     skill_note_count = models.PositiveIntegerField('{skill_note_count}', null=True)
     # should percentage be split into different variales for perfect score and cutin?
     skill_percentage = models.FloatField('{skill_percentage}', null=True)
-    skill_percentage_int = property(lambda _a: int(_a.skill_percentage))
+    skill_percentage_int = property(lambda _a: int(_a.skill_percentage) if _a.skill_percentage is not None else None)
 
     # Subskills
     SUB_SKILL_TYPES = OrderedDict([
@@ -428,6 +592,8 @@ class Photo(MagiModel):
         }),
     ])
 
+    compileTemplates(SUB_SKILL_TYPES.values())
+
     SUB_SKILL_VARIABLES = ['sub_skill_percentage', 'sub_skill_amount']
 
     SUB_SKILL_TYPE_CHOICES = [(_name, _info['translation']) for _name, _info in SUB_SKILL_TYPES.items()]
@@ -436,31 +602,72 @@ class Photo(MagiModel):
 
     sub_skill_template = property(getInfoFromChoices('sub_skill_type', SUB_SKILL_TYPES, 'template'))
     japanese_sub_skill_template = property(getInfoFromChoices('sub_skill_type', SUB_SKILL_TYPES, 'japanese_template'))
+    sub_skill_compiled_template = property(getInfoFromChoices('sub_skill_type', SUB_SKILL_TYPES, 'compiled_template'))
+    japanese_sub_skill_compiled_template = property(getInfoFromChoices('sub_skill_type', SUB_SKILL_TYPES, 'compiled_japanese_template'))
 
-    @property
-    def sub_skill(self):
+    def compute_sub_skill(self):
         if self.i_sub_skill_type is None: return None
-        return self.sub_skill_template.format(**{
-            k: getattr(self, k, '')
-            for k in templateVariables(self.sub_skill_template)
-        })
+        return self.sub_skill_compiled_template.format(self, required=True)
 
-    @property
-    def japanese_sub_skill(self):
+    def compute_japanese_sub_skill(self):
         if self.i_sub_skill_type is None: return None
-        return self.japanese_sub_skill_template.format(**{
-            k: getattr(self, k, '')
-            for k in templateVariables(self.japanese_sub_skill_template)
-        })
+        return self.japanese_sub_skill_compiled_template.format(self, required=True)
 
     sub_skill_amount = models.PositiveIntegerField('{sub_skill_amount}', null=True)
     sub_skill_percentage = models.FloatField('{sub_skill_percentage}', null=True)
     # Currently either 3k (gacha URs) or 2k (All other cards)
     sub_skill_increment = models.PositiveIntegerField(_('Sub skill level up increment'), null=True)
 
+    # Rendered skills
+
+    RENDERED_SKILLS = ['skill', 'japanese_skill', 'sub_skill', 'japanese_sub_skill', 'leader_skill', 'japanese_leader_skill']
+
+    # {language: {rendered skill: string}}, rendered for all LANGUAGES on save and by the rebuild_rendered_skills command
+    _cache_rendered_skills = models.TextField(null=True)
+
+    def render_skills(self, language):
+        """
+        Skills with a missing value, like a photo that isn't filled in yet, are None.
+        """
+        rendered = {}
+        with translation.override(language):
+            for name in self.RENDERED_SKILLS:
+                value = getattr(self, u'compute_{}'.format(name))()
+                rendered[name] = unicode(value) if value is not None else None
+        return rendered
+
+    def update_cache_rendered_skills(self):
+        self._rendered_skills = {
+            language: self.render_skills(language)
+            for language, _verbose_name in django_settings.LANGUAGES
+        }
+        self._cache_rendered_skills = json.dumps(self._rendered_skills)
+
+    @property
+    def rendered_skills(self):
+        if getattr(self, '_rendered_skills', None) is None:
+            self._rendered_skills = json.loads(self._cache_rendered_skills) if self._cache_rendered_skills else {}
+        return self._rendered_skills
+
+    def get_rendered_skill(self, name, language=None):
+        language = language or get_language()
+        if language not in self.rendered_skills:
+            # Not saved: reads must not write, the cache is filled on save
+            self.rendered_skills[language] = self.render_skills(language)
+        return self.rendered_skills[language][name]
+
+    skill = property(lambda _s: _s.get_rendered_skill('skill'))
+    japanese_skill = property(lambda _s: _s.get_rendered_skill('japanese_skill'))
+    sub_skill = property(lambda _s: _s.get_rendered_skill('sub_skill'))
+    japanese_sub_skill = property(lambda _s: _s.get_rendered_skill('japanese_sub_skill'))
+    leader_skill = property(lambda _s: _s.get_rendered_skill('leader_skill'))
+    japanese_leader_skill = property(lambda _s: _s.get_rendered_skill('japanese_leader_skill'))
+
     # Cache idol
 
-    _cache_idol_days = 20
+    # Kept up to date in bulk by the refresh_idol_cache job enqueued when the idol is saved (see update_cache_idol_for_idol),
+    # this is only a safety net: without a run_jobs worker, idol changes stay stale on photos for up to 200 days
+    _cache_idol_days = 200
     _cache_idol_last_update = models.DateTimeField(null=True)
     _cache_j_idol = models.TextField(null=True)
 
@@ -476,14 +683,64 @@ class Photo(MagiModel):
                 'names': {},
                 'image': None,
             }
-        names = self.idol.names or {}
-        names['en'] = self.idol.name
-        names['ja'] = self.idol.japanese_name
-        return {
-            'id': self.idol.id,
-            'names': names,
-            'image': unicode(self.idol.image)
-        }
+        return self.idol.to_cache_for_photos()
+
+    @classmethod
+    def update_cache_idol_for_idol(self, idol):
+        """
+        Refreshes the cached idol of all the photos of that idol in one UPDATE.
+        Returns the number of updated photos.
+        """
+        return self.objects.filter(idol_id=idol.id).update(
+            _cache_j_idol=json.dumps(idol.to_cache_for_photos()),
+            _cache_idol_last_update=timezone.now(),
+            _cache_version=models.F('_cache_version') + 1,
+        )
+
+    # Incremented every time what's displayed about the photo changes, see majilove.fragmentcache
+    _cache_version = models.PositiveIntegerField(default=0)
+
+    CACHE_FIELDS = ['_cache_level_curve', '_cache_rendered_skills', '_cache_j_idol', '_cache_idol_last_update', '_cache_version']
+
+    def update_caches(self):
+        """
+        Updates the CACHE_FIELDS that are computed from the fields of the photo.
+        """
+        self._cache_version = (self._cache_version or 0) + 1
+        self.update_cache_level_curve()
+        self.update_cache_rendered_skills()
+        if self.idol_id:
+            self._cache_j_idol = json.dumps(self.to_cache_idol())
+            self._cache_idol_last_update = timezone.now()
+
+    def save(self, *args, **kwargs):
+        # Jobs are rows written in the same transaction as the photo, they're dropped if the save is rolled back
+        with transaction.atomic():
+            previous = Photo.objects.filter(pk=self.pk).values('_cache_level_curve', *self.IMAGE_FIELDS).first() if self.pk else None
+            previous_level_curve = previous['_cache_level_curve'] if previous else None
+            self.update_caches()
+            result = super(Photo, self).save(*args, **kwargs)
+            from majilove.jobs import enqueue
+            if previous_level_curve is not None and previous_level_curve != self._cache_level_curve:
+                enqueue('update_collectible_photos_stats', key=u'collectible_photos_stats:{}'.format(self.pk), photo_id=self.pk)
+            # File names are only final once saved, the originals are only read again when one of them changed
+            changed_image_fields = [
+                field_name for field_name in self.IMAGE_FIELDS
+                if ((previous[field_name] if previous else None) or '') != (getattr(self, field_name).name or '')
+            ]
+            if changed_image_fields:
+                enqueue('generate_photo_image_derivatives', key=u'photo_image_derivatives:{}:{}'.format(self.pk, ','.join(changed_image_fields)),
+                        photo_id=self.pk, field_names=changed_image_fields)
+        return result
+
+    class Meta:
+        # Combinations of filters of the photo list, ordered by release date
+        index_together = [
+            ('i_rarity', 'i_color', 'release_date'),
+            ('i_color', 'release_date'),
+            ('i_skill_type', 'i_rarity', 'release_date'),
+            ('idol', 'i_rarity', 'release_date'),
+        ]
 
     def __unicode__(self):
         if self.id:
@@ -506,32 +763,36 @@ class CollectiblePhoto(AccountAsOwnerModel):
     leader_bonus = models.PositiveIntegerField(_('Leader skill percentage'), null=True)
     skill_level = models.PositiveIntegerField(_('Skill level'), default=1)
 
+    # Skills and their values are None when the photo misses them
+
     @property
     def skill_percentage(self):
-        return self.photo.skill_percentage + (self.skill_level - 1) * self.photo.skill_increment
+        if self.photo.skill_percentage is None: return None
+        return self.photo.skill_percentage + (self.skill_level - 1) * (self.photo.skill_increment or 0)
     @property
     def skill_note_count(self):
-        return self.photo.skill_note_count + (self.skill_level - 1) * self.photo.skill_increment
+        if self.photo.skill_note_count is None: return None
+        return self.photo.skill_note_count + (self.skill_level - 1) * (self.photo.skill_increment or 0)
+
+    skill_percentage_int = property(lambda _a: int(_a.skill_percentage) if _a.skill_percentage is not None else None)
 
     @property
     def skill(self):
-        return self.photo.skill_template.format({
-            k: getattr(self, k)
-            for k in templateVariables(self.photo.skill_template)
-        })
+        if self.photo.i_skill_type is None or self.photo.skill_compiled_template is None: return None
+        return self.photo.skill_compiled_template.format(self, fallback_item=self.photo, required=True)
 
     sub_skill_level = models.PositiveIntegerField(_('Sub skill level'), null=True)
     @property
     def sub_skill_amount(self):
-        return self.photo.sub_skill_amount + (self.sub_skill_level - 1) * self.photo.sub_skill_increment
+        if self.photo.sub_skill_amount is None: return None
+        # Sub skill levels start at 1 and are optional
+        return self.photo.sub_skill_amount + ((self.sub_skill_level or 1) - 1) * (self.photo.sub_skill_increment or 0)
 
     @property
     def sub_skill(self):
-        _sub_skill_variables = {k: getattr(self.photo, k)
-        for k in templateVariables(self.photo.sub_skill_template
-        )}
-        _sub_skill_variables['sub_skill_amount'] = self.sub_skill_amount
-        return self.photo.sub_skill_template.format(**_sub_skill_variables)
+        if self.photo.i_sub_skill_type is None or self.sub_skill_amount is None: return None
+        if u'{sub_skill_percentage}' in unicode(self.photo.sub_skill_template) and self.photo.sub_skill_percentage is None: return None
+        return self.photo.sub_skill_compiled_template.format(self.photo, sub_skill_amount=self.sub_skill_amount)
 
     rank = models.PositiveIntegerField(_('Rank'), default=1)
 
@@ -543,7 +804,8 @@ class CollectiblePhoto(AccountAsOwnerModel):
     bonus_moment_squares_unlocked = models.PositiveIntegerField(_('Number of moment squares unlocked past 100%'), default = 0)
     @property
     def special_shot_unlocked(self):
-        return self.moments_unlocked >= self.photo.special_shot_percentage
+        if self.photo.rarity_special_shot_percentage is None: return False
+        return self.moments_unlocked >= self.photo.rarity_special_shot_percentage
 
     prefer_normal_shot = models.BooleanField(_('Prefer normal shot photo image'), default=False)
 
@@ -558,6 +820,7 @@ class CollectiblePhoto(AccountAsOwnerModel):
     @property
     def final_leader_skill_percentage(self):
         if self.leader_bonus: return self.leader_bonus
+        if self.photo.leader_skill_percentage is None: return None
         if self.photo.rarity is 'UR' and self.bonus_moment_squares_unlocked is 16: return 70
         _extra_squares = self.bonus_moment_squares_unlocked - 1
         if self.photo.rarity is 'UR': _extra_squares = (self.bonus_moment_squares_unlocked // 4) - 1
@@ -566,12 +829,8 @@ class CollectiblePhoto(AccountAsOwnerModel):
 
     @property
     def leader_skill(self):
-        _leader_skill_variables = {
-            k: getattr(self.photo, k)
-            for k in templateVariables(Photo.LEADER_SKILL_INFO['template'])
-        }
-        _leader_skill_variables['leader_skill_percentage'] = self.final_leader_skill_percentage
-        return Photo.LEADER_SKILL_INFO['template'].format(**_leader_skill_variables)
+        if self.photo.i_leader_skill_stat is None or self.final_leader_skill_percentage is None: return None
+        return Photo.LEADER_SKILL_INFO['compiled_template'].format(self.photo, leader_skill_percentage=self.final_leader_skill_percentage)
 
     CROWN_OPTIONS = [150, 200] #Now only 200; change this to a variable
     CROWN_TYPES = [
@@ -580,6 +839,7 @@ class CollectiblePhoto(AccountAsOwnerModel):
         'rainbow',
     ]
     CROWN_TEMPLATE = '+{crown_amount} {crown_attribute}'
+    CROWN_COMPILED_TEMPLATE = CompiledTemplate(CROWN_TEMPLATE)
     SILVER_CROWN_AMOUNT_CHOICES = CROWN_OPTIONS
     i_silver_crown_amount = models.PositiveIntegerField(_('Silver crown bonus'), choices=i_choices(SILVER_CROWN_AMOUNT_CHOICES), null=True)
     SILVER_CROWN_ATTRIBUTE_CHOICES = Photo.LEADER_SKILL_STAT_CHOICES
@@ -587,10 +847,7 @@ class CollectiblePhoto(AccountAsOwnerModel):
     @property
     def silver_crown(self):
         if self.silver_crown_attribute is None: return None
-        return CROWN_TEMPLATE.format(**{
-            k: getattr(self, 'silver_{}'.format(k))
-            for k in templateVariables(CROWN_TEMPLATE)
-        })
+        return self.CROWN_COMPILED_TEMPLATE.format(self, prefix=u'silver_')
 
     GOLD_CROWN_AMOUNT_CHOICES = CROWN_OPTIONS
     i_gold_crown_amount = models.PositiveIntegerField(_('Gold crown bonus'), choices=i_choices(GOLD_CROWN_AMOUNT_CHOICES), null=True)
@@ -599,10 +856,7 @@ class CollectiblePhoto(AccountAsOwnerModel):
     @property
     def gold_crown(self):
         if self.gold_crown_attribute is None: return None
-        return CROWN_TEMPLATE.format(**{
-            k: getattr(self, 'gold_{}'.format(k))
-            for k in templateVariables(CROWN_TEMPLATE)
-        })
+        return self.CROWN_COMPILED_TEMPLATE.format(self, prefix=u'gold_')
 
     RAINBOW_CROWN_AMOUNT_CHOICES = CROWN_OPTIONS
     i_rainbow_crown_amount = models.PositiveIntegerField(_('Rainbow crown bonus'), choices=i_choices(RAINBOW_CROWN_AMOUNT_CHOICES), null=True)
@@ -611,23 +865,20 @@ class CollectiblePhoto(AccountAsOwnerModel):
     @property
     def rainbow_crown(self):
         if self.rainbow_crown_attribute is None: return None
-        return CROWN_TEMPLATE.format(**{
-            k: getattr(self, 'rainbow_{}'.format(k))
-            for k in templateVariables(CROWN_TEMPLATE)
-        })
+        return self.CROWN_COMPILED_TEMPLATE.format(self, prefix=u'rainbow_')
 
     @property
     def crown_dance_boost(self):
-        return sum([getattr(self, '{}_crown_amount'.format(v)) for v in CROWN_TYPES
-            if getattr(self, '{}_crown_attribute'.format(v)) is 'dance'])
+        return sum([getattr(self, '{}_crown_amount'.format(v)) or 0 for v in self.CROWN_TYPES
+            if getattr(self, '{}_crown_attribute'.format(v)) == 'dance'])
     @property
     def crown_vocal_boost(self):
-        return sum([getattr(self, '{}_crown_amount'.format(v)) for v in CROWN_TYPES
-            if getattr(self, '{}_crown_attribute'.format(v)) is 'vocal'])
+        return sum([getattr(self, '{}_crown_amount'.format(v)) or 0 for v in self.CROWN_TYPES
+            if getattr(self, '{}_crown_attribute'.format(v)) == 'vocal'])
     @property
     def crown_charm_boost(self):
-        return sum([getattr(self, '{}_crown_amount'.format(v)) for v in CROWN_TYPES
-            if getattr(self, '{}_crown_attribute'.format(v)) is 'charm'])
+        return sum([getattr(self, '{}_crown_amount'.format(v)) or 0 for v in self.CROWN_TYPES
+            if getattr(self, '{}_crown_attribute'.format(v)) == 'charm'])
 
     custom_dance_stat = models.PositiveIntegerField(_('Dance'), null=True)
     custom_vocal_stat = models.PositiveIntegerField(_('Vocal'), null=True)
@@ -636,28 +887,13 @@ class CollectiblePhoto(AccountAsOwnerModel):
     # pre moment stats
     @property
     def level_dance_stat(self):
-        if self.level == 1: return self.photo.dance_min
-        if self.level == self.photo.single_max_level: return self.photo.dance_single_copy_max
-        if self.level == self.photo.max_max_level: return self.photo.dance_max_copy_max
-        if self.level < self.photo.single_max_level:
-            return self.photo.dance_min + ((self.level - 1) * self.photo.dance_single_copy_increment)
-        return self.photo.dance_single_copy_max + ((self.level - self.photo.single_max_level) * self.photo.dance_combined_increment)
+        return self.photo.level_stat('dance', self.level)
     @property
     def level_vocal_stat(self):
-        if self.level == 1: return self.photo.vocal_min
-        if self.level == self.photo.single_max_level: return self.photo.vocal_single_copy_max
-        if self.level == self.photo.max_max_level: return self.photo.vocal_max_copy_max
-        if self.level < self.photo.single_max_level:
-            return self.photo.vocal_min + ((self.level - 1) * self.photo.vocal_single_copy_increment)
-        return self.photo.vocal_single_copy_max + ((self.level - self.photo.single_max_level) * self.photo.vocal_combined_increment)
+        return self.photo.level_stat('vocal', self.level)
     @property
     def level_charm_stat(self):
-        if self.level == 1: return self.photo.charm_min
-        if self.level == self.photo.single_max_level: return self.photo.charm_single_copy_max
-        if self.level == self.photo.max_max_level: return self.photo.charm_max_copy_max
-        if self.level < self.photo.single_max_level:
-            return self.photo.charm_min + ((self.level - 1) * self.photo.charm_single_copy_increment)
-        return self.photo.charm_single_copy_max + ((self.level - self.photo.single_max_level) * self.photo.charm_combined_increment)
+        return self.photo.level_stat('charm', self.level)
 
     @property
     def moment_squares_unlocked(self):
@@ -676,23 +912,293 @@ class CollectiblePhoto(AccountAsOwnerModel):
 
     @property
     def display_dance(self):
-        if self.custom_dance_stat: self.custom_dance_stat
+        if self.custom_dance_stat: return self.custom_dance_stat
         return self.level_dance_stat + self.moment_dance_bonus + self.crown_dance_boost
     @property
     def display_vocal(self):
-        if self.custom_vocal_stat: self.custom_vocal_stat
+        if self.custom_vocal_stat: return self.custom_vocal_stat
         return self.level_vocal_stat + self.moment_vocal_bonus + self.crown_vocal_boost
     @property
     def display_charm(self):
-        if self.custom_charm_stat: self.custom_charm_stat
+        if self.custom_charm_stat: return self.custom_charm_stat
         return self.level_charm_stat + self.moment_charm_bonus + self.crown_charm_boost
 
     @property
     def total_stats(self):
         return self.display_dance + self.display_vocal + self.display_charm
 
+    @classmethod
+    def bulk_display_stats(self, queryset):
+        """
+        Returns {collectible photo id: (dance, vocal, charm, total)} for the whole queryset,
+        computed in one vectorized pass over the level curves of the photos.
+        Gives the same numbers as display_dance, display_vocal, display_charm and total_stats.
+        """
+        crown_fields = [u'i_{}_crown_{}'.format(crown, field) for crown in self.CROWN_TYPES for field in ['amount', 'attribute']]
+        rows = list(queryset.values_list(
+            'id', 'photo_id', 'level', 'moments_unlocked', 'bonus_moment_squares_unlocked',
+            'custom_dance_stat', 'custom_vocal_stat', 'custom_charm_stat', *crown_fields))
+        if not rows:
+            return {}
+        photos = {
+            photo.id: photo for photo in Photo.objects.filter(id__in=set(row[1] for row in rows))
+        }
+        photo_ids = photos.keys()
+        photo_index = { photo_id: i for i, photo_id in enumerate(photo_ids) }
+        curve_length = max(len(photo.level_curve) for photo in photos.values())
+        curves = np.zeros((len(photo_ids), curve_length, 3))
+        for i, photo_id in enumerate(photo_ids):
+            curve = photos[photo_id].level_curve
+            curves[i, :len(curve)] = curve
+        lengths = np.array([len(photos[photo_id].level_curve) for photo_id in photo_ids])
+        squares_in_moments = np.array([photos[photo_id].rarity_squares_in_moments for photo_id in photo_ids])
+        is_ur = np.array([photos[photo_id].rarity == 'UR' for photo_id in photo_ids])
+
+        columns = zip(*rows)
+        ids = columns[0]
+        photo_i = np.array([photo_index[photo_id] for photo_id in columns[1]])
+        level = np.array(columns[2])
+        moments_unlocked = np.array(columns[3])
+        bonus_squares = np.array(columns[4])
+        custom = np.array([[value or 0 for value in column] for column in columns[5:8]]).T
+
+        # Level stats, levels outside of the curve fall back to the formula
+        in_curve = (level >= 1) & (level <= lengths[photo_i])
+        stats = curves[photo_i, np.clip(level - 1, 0, curve_length - 1)]
+        for row in np.nonzero(~in_curve)[0]:
+            photo = photos[photo_ids[photo_i[row]]]
+            stats[row] = [photo.compute_level_stat(stat, level[row]) for stat in Photo.STATISTICS.keys()]
+
+        # Moments
+        squares = (np.floor_divide(moments_unlocked, 100) * squares_in_moments[photo_i]
+                   + np.where(is_ur[photo_i], bonus_squares, 0)).astype(float)
+        stats[:, 0] += np.ceil(squares / 4) * 30
+        stats[:, 1] += (squares // 4 + (squares % 4 >= 2)) * 30
+        stats[:, 2] += (squares // 4 + (squares % 4 >= 3)) * 30
+
+        # Crowns
+        crown_options = np.array(self.CROWN_OPTIONS)
+        for i in range(len(self.CROWN_TYPES)):
+            amounts, attributes = columns[8 + i * 2], columns[9 + i * 2]
+            has_crown = np.array([amount is not None and attribute is not None for amount, attribute in zip(amounts, attributes)])
+            if not has_crown.any():
+                continue
+            amount = crown_options[np.array([amount or 0 for amount in amounts])]
+            attribute = np.array([attribute or 0 for attribute in attributes])
+            np.add.at(stats, (np.nonzero(has_crown)[0], attribute[has_crown]), amount[has_crown])
+
+        stats = np.where(custom > 0, custom, stats)
+        totals = stats.sum(axis=1)
+        return {
+            id: tuple(stat_values) + (total,)
+            for id, stat_values, total in zip(ids, stats.tolist(), totals.tolist())
+        }
+
+    @classmethod
+    def display_stats_for_account(self, account):
+        return self.bulk_display_stats(self.objects.filter(account=account))
+
+    # Cache stats
+
+    _cache_stats_last_update = models.DateTimeField(null=True)
+    _cache_stats_dance = models.FloatField(null=True, db_index=True)
+    _cache_stats_vocal = models.FloatField(null=True, db_index=True)
+    _cache_stats_charm = models.FloatField(null=True, db_index=True)
+    _cache_stats_total = models.FloatField(null=True, db_index=True)
+
+    CACHE_STATS_FIELDS = ['_cache_stats_last_update', '_cache_stats_dance', '_cache_stats_vocal', '_cache_stats_charm', '_cache_stats_total']
+
+    def update_cache_stats(self):
+        self._cache_stats_last_update = timezone.now()
+        self._cache_stats_dance = self.display_dance
+        self._cache_stats_vocal = self.display_vocal
+        self._cache_stats_charm = self.display_charm
+        self._cache_stats_total = self._cache_stats_dance + self._cache_stats_vocal + self._cache_stats_charm
+
+    @classmethod
+    def update_cache_stats_for_queryset(self, queryset, chunk_size=1000, update_summaries=True):
+        """
+        Recomputes the cached stats of all the collectible photos in queryset,
+        chunk_size rows at a time, one executemany UPDATE and one transaction per chunk.
+        The collection summaries of their accounts are then updated by jobs, unless update_summaries is False.
+        Returns the number of updated rows.
+        """
+        rows = list(queryset.order_by('id').values_list('id', 'account_id'))
+        ids = [id for id, _account_id in rows]
+        using = router.db_for_write(self)
+        connection = connections[using]
+        now = self._meta.get_field('_cache_stats_last_update').get_db_prep_value(timezone.now(), connection)
+        sql = u'UPDATE {} SET {} WHERE {} = %s'.format(
+            connection.ops.quote_name(self._meta.db_table),
+            u', '.join(u'{} = %s'.format(connection.ops.quote_name(field)) for field in self.CACHE_STATS_FIELDS),
+            connection.ops.quote_name(self._meta.pk.column),
+        )
+        for start in range(0, len(ids), chunk_size):
+            stats = self.bulk_display_stats(self.objects.filter(id__in=ids[start:start + chunk_size]))
+            with transaction.atomic(using=using):
+                connection.cursor().executemany(sql, [
+                    (now, dance, vocal, charm, total, id)
+                    for id, (dance, vocal, charm, total) in stats.items()
+                ])
+        if update_summaries:
+            from majilove.jobs import enqueue
+            for account_id in set(account_id for _id, account_id in rows):
+                enqueue('update_account_collection_summary', key=u'collection_summary:{}'.format(account_id), account_id=account_id)
+        return len(ids)
+
+    @classmethod
+    def strongest(self, account, limit=None):
+        queryset = self.objects.filter(account=account).order_by('-_cache_stats_total', 'id')
+        return queryset[:limit] if limit else queryset
+
+    def save(self, *args, **kwargs):
+        self.update_cache_stats()
+        return super(CollectiblePhoto, self).save(*args, **kwargs)
+
+    class Meta:
+        # Strongest photos of an account
+        index_together = [('account', '_cache_stats_total')]
+
     def __unicode__(self):
         if self.id:
             return unicode(self.photo)
         return super(CollectiblePhoto, self).__unicode__()
 
+############################################################
+# Account collection summary
+
+class AccountCollectionSummary(models.Model):
+    """
+    Counts and power of the collectible photos of an account, kept up to date by jobs enqueued
+    by signals and by update_cache_stats_for_queryset, see majilove.collectionsummary.
+    """
+    account = models.OneToOneField(Account, related_name='collection_summary', primary_key=True)
+    last_update = models.DateTimeField(null=True)
+
+    total_photos = models.PositiveIntegerField(default=0)
+    unique_photos = models.PositiveIntegerField(default=0)
+    completion_percentage = models.FloatField(default=0, db_index=True)
+    # Total stats of the TEAM_SIZE strongest photos
+    team_power = models.FloatField(default=0, db_index=True)
+
+    n_photos = models.PositiveIntegerField(default=0)
+    r_photos = models.PositiveIntegerField(default=0)
+    sr_photos = models.PositiveIntegerField(default=0)
+    ur_photos = models.PositiveIntegerField(default=0)
+
+    star_photos = models.PositiveIntegerField(default=0)
+    shine_photos = models.PositiveIntegerField(default=0)
+    dream_photos = models.PositiveIntegerField(default=0)
+
+    @property
+    def photos_by_rarity(self):
+        return OrderedDict([(rarity, getattr(self, u'{}_photos'.format(rarity.lower()))) for rarity in Photo.RARITIES.keys()])
+
+    @property
+    def photos_by_color(self):
+        return OrderedDict([(color, getattr(self, u'{}_photos'.format(color))) for color, _verbose_name in Photo.COLOR_CHOICES])
+
+############################################################
+# Search index
+
+class SearchNgram(models.Model):
+    """
+    N-grams of the names of idols and photos in all languages, see majilove.search.
+    """
+    collection = models.CharField(max_length=20)
+    item_id = models.PositiveIntegerField()
+    ngram = models.CharField(max_length=2)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        index_together = [('collection', 'ngram')]
+        unique_together = [('collection', 'item_id', 'ngram')]
+
+############################################################
+# Jobs
+
+class Job(models.Model):
+    """
+    Work done outside of requests by the run_jobs workers, see majilove.jobs.
+    """
+    name = models.CharField(max_length=100)
+    # JSON keyword arguments of the task
+    arguments = models.TextField(default='{}')
+    # Only one pending job per key
+    key = models.CharField(max_length=200, null=True, db_index=True)
+    priority = models.IntegerField(default=0)
+
+    # Done jobs are deleted
+    STATUS_CHOICES = ('pending', 'running', 'failed')
+    i_status = models.PositiveIntegerField(choices=i_choices(STATUS_CHOICES), default=0)
+    run_after = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    worker = models.CharField(max_length=100, null=True)
+    started_at = models.DateTimeField(null=True)
+    last_error = models.TextField(null=True)
+    creation = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def status(self):
+        return self.STATUS_CHOICES[self.i_status]
+
+    class Meta:
+        index_together = [('i_status', 'priority', 'run_after')]
+
+    def __unicode__(self):
+        return u'{} #{} ({})'.format(self.name, self.id, self.status)
+
+############################################################
+# Signals
+
+@receiver(post_save, sender=Idol)
+def update_photos_cached_idol(sender, instance, **kwargs):
+    from majilove.jobs import enqueue
+    enqueue('refresh_idol_cache', key=u'idol_cache:{}'.format(instance.id), idol_id=instance.id)
+
+@receiver(post_save, sender=Photo)
+def update_collection_summaries_completion(sender, instance, created=False, raw=False, **kwargs):
+    if not created or raw: return
+    from majilove.jobs import enqueue
+    enqueue('update_collection_completions', key='collection_completions')
+
+@receiver(post_delete, sender=Photo)
+def update_collection_summaries_completion_on_delete(sender, instance, **kwargs):
+    from majilove.jobs import enqueue
+    enqueue('update_collection_completions', key='collection_completions')
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+def invalidate_photo_facets(sender, instance, **kwargs):
+    from majilove.facets import invalidate
+    invalidate()
+
+@receiver(post_save, sender=Photo)
+def index_photo(sender, instance, raw=False, **kwargs):
+    if raw: return
+    from majilove.jobs import enqueue
+    enqueue('index_photo', key=u'index_photo:{}'.format(instance.pk), photo_id=instance.pk)
+
+@receiver(post_save, sender=CollectiblePhoto)
+@receiver(post_delete, sender=CollectiblePhoto)
+def update_account_collection_summary(sender, instance, raw=False, **kwargs):
+    if raw: return
+    from majilove.jobs import enqueue
+    enqueue('update_account_collection_summary', key=u'collection_summary:{}'.format(instance.account_id), account_id=instance.account_id)
+
+@receiver(post_delete, sender=Account)
+def remove_account_rank(sender, instance, **kwargs):
+    if instance.level is None: return
+    from majilove.jobs import enqueue
+    enqueue('update_account_ranks', key='account_ranks')
+
+@receiver(post_delete, sender=Idol)
+def unindex_idol(sender, instance, **kwargs):
+    from majilove.search import unindexItems
+    unindexItems('idol', [instance.pk])
+
+@receiver(post_delete, sender=Photo)
+def unindex_photo(sender, instance, **kwargs):
+    from majilove.search import unindexItems
+    unindexItems('photo', [instance.pk])
@@ -0,0 +1,83 @@
+from django.core import signing
+from django.db import connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+
+TOKEN_SALT = 'majilove.pagination'
+TOKEN_PARAMETER = 'after'
+
+# Keys are (field, descending), the last one must be unique
+PHOTOS_KEYS = [('release_date', True), ('id', True)]
+
+def ordering(keys):
+    return [u'{}{}'.format('-' if descending else '', field) for field, descending in keys]
+
+def encodeToken(keys, item):
+    values = [getattr(item, field) for field, _descending in keys]
+    return signing.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values], salt=TOKEN_SALT, compress=True)
+
+def decodeToken(token):
+    """
+    Values of the keys of the last item of the previous page, None if the token is invalid.
+    """
+    try:
+        return signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        return None
+
+def _equal(field, value):
+    return Q(**{ u'{}__isnull'.format(field): True }) if value is None else Q(**{ field: value })
+
+def nullsLargest(vendor):
+    # NULL sorts after any value in PostgreSQL, before any value in SQLite and MySQL
+    return vendor == 'postgresql'
+
+def _after(field, descending, value, nulls_largest=False):
+    nulls_last = descending != nulls_largest
+    if value is None:
+        return None if nulls_last else Q(**{ u'{}__isnull'.format(field): False })
+    after = Q(**{ u'{}__{}'.format(field, 'lt' if descending else 'gt'): value })
+    return after | Q(**{ u'{}__isnull'.format(field): True }) if nulls_last else after
+
+def afterFilter(keys, values, nulls_largest=False):
+    """
+    Q matching the items that come after values in the order of keys.
+    """
+    condition = None
+    for i, (field, descending) in enumerate(keys):
+        after = _after(field, descending, values[i], nulls_largest=nulls_largest)
+        if after is None:
+            continue
+        for j, (previous_field, _descending) in enumerate(keys[:i]):
+            after &= _equal(previous_field, values[j])
+        condition = after if condition is None else condition | after
+    return condition
+
+class FixedOrderQuerySet(QuerySet):
+    """
+    Keeps its ordering when the list view orders it again, like the keys of keysetQueryset or a search rank.
+    """
+    def order_by(self, *field_names):
+        return self._clone()
+
+def keysetQueryset(queryset, keys, token=None):
+    """
+    Orders queryset by keys and, when a valid token is given, starts right after the item it was made from.
+    Each page is then read from the index at the same cost, however deep it is.
+    Ordering the returned queryset again doesn't change its order.
+    """
+    queryset = queryset.order_by(*ordering(keys))
+    values = decodeToken(token) if token else None
+    if values is not None and len(values) == len(keys):
+        condition = afterFilter(keys, values, nulls_largest=nullsLargest(connections[queryset.db].vendor))
+        queryset = queryset.filter(condition) if condition is not None else queryset.none()
+    return queryset._clone(klass=FixedOrderQuerySet)
+
+def keysetPage(queryset, keys, token=None, page_size=50):
+    """
+    Returns (items, next page token or None).
+    """
+    items = list(keysetQueryset(queryset, keys, token)[:page_size + 1])
+    if len(items) > page_size:
+        return items[:page_size], encodeToken(keys, items[page_size - 1])
+    return items, None
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import json, unicodedata
+from django.db import transaction
+from django.db.models import Count, Sum
+from majilove import models
+from majilove.pagination import FixedOrderQuerySet
+
+# Weight of the n-grams of the main names (romaji and japanese) vs translations
+MAIN_NAME_WEIGHT = 2
+TRANSLATION_WEIGHT = 1
+
+MAX_RESULTS = 500
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', unicode(text)).lower()
+
+def ngrams(text):
+    """
+    Unigrams and bigrams of each word, so it works for languages without spaces like Japanese.
+    """
+    grams = set()
+    for word in normalize(text).split():
+        grams.update(word)
+        grams.update(word[i:i + 2] for i in range(len(word) - 1))
+    return grams
+
+def queryNgrams(query):
+    grams = set()
+    for word in normalize(query).split():
+        if len(word) == 1:
+            grams.add(word)
+        else:
+            grams.update(word[i:i + 2] for i in range(len(word) - 1))
+    return grams
+
+############################################################
+# Texts of each collection
+
+def idolTexts(idol):
+    return (
+        [idol.name, idol.japanese_name],
+        (idol.names or {}).values(),
+    )
+
+def photoTexts(photo):
+    idol_names = json.loads(photo._cache_j_idol)['names'].values() if photo._cache_j_idol else []
+    return (
+        [photo.name],
+        (photo.names or {}).values() + idol_names,
+    )
+
+COLLECTIONS = {
+    'idol': (models.Idol, idolTexts),
+    'photo': (models.Photo, photoTexts),
+}
+
+############################################################
+# Index
+
+def itemNgrams(collection, item):
+    weights = {}
+    main_texts, other_texts = COLLECTIONS[collection][1](item)
+    for texts, weight in [(other_texts, TRANSLATION_WEIGHT), (main_texts, MAIN_NAME_WEIGHT)]:
+        for text in texts:
+            if text:
+                for gram in ngrams(text):
+                    weights[gram] = max(weights.get(gram, 0), weight)
+    return [
+        models.SearchNgram(collection=collection, item_id=item.pk, ngram=gram, weight=weight)
+        for gram, weight in weights.items()
+    ]
+
+def indexItems(collection, items):
+    items = list(items)
+    with transaction.atomic():
+        models.SearchNgram.objects.filter(collection=collection, item_id__in=[item.pk for item in items]).delete()
+        models.SearchNgram.objects.bulk_create([
+            ngram for item in items for ngram in itemNgrams(collection, item)
+        ], batch_size=1000)
+
+def unindexItems(collection, item_ids):
+    models.SearchNgram.objects.filter(collection=collection, item_id__in=item_ids).delete()
+
+def rebuildIndex(collection, chunk_size=500):
+    model = COLLECTIONS[collection][0]
+    models.SearchNgram.objects.filter(collection=collection).delete()
+    ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), chunk_size):
+        indexItems(collection, model.objects.filter(pk__in=ids[start:start + chunk_size]))
+    return len(ids)
+
+############################################################
+# Search
+
+def search(collection, query, limit=MAX_RESULTS):
+    """
+    Returns the ids of the items matching all the n-grams of query, best first.
+    """
+    grams = queryNgrams(query)
+    if not grams:
+        return []
+    return [result['item_id'] for result in models.SearchNgram.objects.filter(
+        collection=collection, ngram__in=grams,
+    ).values('item_id').annotate(
+        matched=Count('ngram', distinct=True), rank=Sum('weight'),
+    ).filter(matched=len(grams)).order_by('-rank', 'item_id')[:limit]]
+
+def searchQueryset(queryset, collection, query, ranked=True):
+    """
+    Filters queryset on the results of the search.
+    When ranked, they're ordered by rank and ordering them again doesn't change that.
+    """
+    ids = search(collection, query)
+    if not ids:
+        return queryset.none()
+    queryset = queryset.filter(pk__in=ids)
+    if not ranked:
+        return queryset
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        select={ 'search_rank': u'CASE {} END'.format(u' '.join(
+            u'WHEN {}.{} = {} THEN {}'.format(table, queryset.model._meta.pk.column, int(item_id), rank)
+            for rank, item_id in enumerate(ids)
+        )) },
+    ).order_by('search_rank')._clone(klass=FixedOrderQuerySet)
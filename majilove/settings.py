@@ -1,9 +1,8 @@
 # -*- coding: utf-8 -*-
-import datetime, pytz
+import sys, types
 from django.conf import settings as django_settings
 from django.utils.translation import ugettext_lazy as _
 from magi.default_settings import DEFAULT_ENABLED_PAGES
-from majilove import models
 
 ############################################################
 # General settings
@@ -17,7 +16,6 @@ EMPTY_IMAGE = 'emptyicon.png'
 DONATE_IMAGE = 'donate.png'
 SITE_NAV_LOGO = 'majilove_title_white.png'
 SITE_STATIC_URL = '//localhost:{}/'.format(django_settings.DEBUG_PORT) if django_settings.DEBUG else '//i.maji.love/'
-ACCOUNT_MODEL = models.Account
 COLOR = '#5acccd'
 
 ############################################################
@@ -64,8 +62,36 @@ GOOGLE_ANALYTICS = 'UA-118452679-1'
 DISQUS_SHORTNAME = 'maji-love'
 
 ############################################################
-# Generated settings
-
-TOTAL_DONATORS = django_settings.TOTAL_DONATORS
-LATEST_NEWS = django_settings.LATEST_NEWS
-STAFF_CONFIGURATIONS = django_settings.STAFF_CONFIGURATIONS
+# Lazy settings
+
+def _accountModel():
+    from majilove import models
+    return models.Account
+
+# Resolved on first use, so importing the settings doesn't import the models
+# or read the generated settings
+LAZY_SETTINGS = {
+    'ACCOUNT_MODEL': _accountModel,
+    'TOTAL_DONATORS': lambda: django_settings.TOTAL_DONATORS,
+    'LATEST_NEWS': lambda: django_settings.LATEST_NEWS,
+    'STAFF_CONFIGURATIONS': lambda: django_settings.STAFF_CONFIGURATIONS,
+}
+
+class _LazySettingsModule(types.ModuleType):
+    def __init__(self, module):
+        super(_LazySettingsModule, self).__init__(module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # Keeps the globals of the functions above alive
+        self._module = module
+
+    def __getattr__(self, name):
+        if name not in LAZY_SETTINGS:
+            raise AttributeError(name)
+        value = LAZY_SETTINGS[name]()
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__.keys()) | set(LAZY_SETTINGS.keys()))
+
+sys.modules[__name__] = _LazySettingsModule(sys.modules[__name__])
@@ -0,0 +1,127 @@
+from multiprocessing import Pool
+import numpy as np
+
+# Judgements: perfect, great, good, bad
+JUDGEMENTS = ['perfect', 'great', 'good', 'bad']
+JUDGEMENT_SCORE_MULTIPLIERS = np.array([1., .8, .5, 0.])
+DEFAULT_ACCURACY = [.85, .1, .03, .02]
+
+DEFAULT_CHART = {
+    # Notes in the song
+    'notes': 500,
+    # Score of a perfect note per point of team power
+    'note_score_per_power': .01,
+    # Chances each card gets to trigger its skill during the song, and probability of each trigger
+    'skill_triggers': 10,
+    'skill_chance': .3,
+    # Notes affected by one activation of perfect_score
+    'skill_duration': 10,
+    # Share of the score given by the cut-in bonus, before cutin skills
+    'cutin_bonus': .05,
+    'stamina': 100,
+    'bad_stamina_loss': 5,
+    'healer_note_stamina': 3,
+}
+
+PERCENTAGE_SKILLS = ['perfect_score', 'cutin']
+
+PERCENTILES = [5, 25, 50, 75, 95]
+
+def teamSpec(cards):
+    """
+    Plain picklable description of a team of collectible photos, for simulate.
+    """
+    spec = {
+        'power': sum(card.total_stats for card in cards),
+        'skills': [],
+        'sub_skills': [],
+    }
+    for card in cards:
+        # Skills without their values are left out
+        skill_type = card.photo.skill_type
+        value = None if skill_type is None else (card.skill_percentage if skill_type in PERCENTAGE_SKILLS else card.skill_note_count)
+        if value is not None:
+            spec['skills'].append((skill_type, value))
+        sub_skill_type = card.photo.sub_skill_type
+        if sub_skill_type is not None and card.sub_skill_amount is not None:
+            spec['sub_skills'].append((sub_skill_type, card.sub_skill_amount, card.photo.sub_skill_percentage))
+    return spec
+
+def _simulateRuns(arguments):
+    spec, chart, accuracy, runs, seed = arguments
+    random = np.random.RandomState(seed)
+    notes = chart['notes']
+    judgements = random.multinomial(notes, accuracy, size=runs).astype(float)
+    extra_notes = np.zeros(runs)
+    perfect_boost = np.zeros(runs)
+    cutin_boost = np.zeros(runs)
+    healed = np.zeros(runs)
+
+    for skill_type, value in spec['skills']:
+        activations = random.binomial(chart['skill_triggers'], chart['skill_chance'], size=runs)
+        if skill_type == 'score_notes':
+            extra_notes += activations * value
+        elif skill_type == 'perfect_score':
+            boosted = np.minimum(activations * chart['skill_duration'], notes) * judgements[:, 0] / notes
+            perfect_boost += boosted * value / 100.
+        elif skill_type == 'cutin':
+            cutin_boost += activations * value / 100.
+        elif skill_type == 'good_lock':
+            locked = np.minimum(activations * value, judgements[:, 3])
+            judgements[:, 3] -= locked
+            judgements[:, 2] += locked
+        elif skill_type == 'great_lock':
+            locked_bad = np.minimum(activations * value, judgements[:, 3])
+            locked_good = np.minimum(activations * value - locked_bad, judgements[:, 2])
+            judgements[:, 3] -= locked_bad
+            judgements[:, 2] -= locked_good
+            judgements[:, 1] += locked_bad + locked_good
+        elif skill_type == 'healer':
+            healed += activations * value * chart['healer_note_stamina']
+
+    note_score = spec['power'] * chart['note_score_per_power']
+    score = (judgements.dot(JUDGEMENT_SCORE_MULTIPLIERS) + extra_notes + perfect_boost) * note_score
+    score += score * chart['cutin_bonus'] * (1 + cutin_boost)
+
+    stamina = np.clip(chart['stamina'] - judgements[:, 3] * chart['bad_stamina_loss'] + healed, 0, chart['stamina'])
+    for sub_skill_type, amount, percentage in spec['sub_skills']:
+        if sub_skill_type == 'full_combo':
+            score += np.where(judgements[:, 2] + judgements[:, 3] == 0, amount, 0)
+        elif sub_skill_type == 'stamina':
+            score += np.where(stamina * 100. / chart['stamina'] >= (percentage or 0), amount, 0)
+    # Failed lives don't score
+    return np.where(stamina > 0, score, 0)
+
+def simulate(team, chart=None, accuracy=None, runs=10000, processes=None, seed=None):
+    """
+    Simulates runs lives of a team (collectible photos or a teamSpec) on a chart (see DEFAULT_CHART),
+    all the runs at once as numpy arrays, optionally split across a pool of processes.
+    Returns the expected score, standard deviation, min, max and PERCENTILES of the score distribution.
+    """
+    spec = team if isinstance(team, dict) else teamSpec(team)
+    full_chart = DEFAULT_CHART.copy()
+    full_chart.update(chart or {})
+    accuracy = np.array(accuracy or DEFAULT_ACCURACY, dtype=float)
+    accuracy /= accuracy.sum()
+    random = np.random.RandomState(seed)
+    if processes and processes > 1:
+        chunks = [runs // processes + (1 if i < runs % processes else 0) for i in range(processes)]
+        pool = Pool(processes)
+        try:
+            scores = np.concatenate(pool.map(_simulateRuns, [
+                (spec, full_chart, accuracy, chunk, random.randint(2 ** 31))
+                for chunk in chunks if chunk
+            ]))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        scores = _simulateRuns((spec, full_chart, accuracy, runs, random.randint(2 ** 31)))
+    return {
+        'runs': runs,
+        'expected': float(scores.mean()),
+        'std': float(scores.std()),
+        'min': float(scores.min()),
+        'max': float(scores.max()),
+        'percentiles': dict(zip(PERCENTILES, np.percentile(scores, PERCENTILES).tolist())),
+    }
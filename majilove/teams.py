@@ -0,0 +1,82 @@
+import heapq
+from itertools import combinations
+import numpy as np
+from majilove.models import Photo, CollectiblePhoto
+
+TEAM_SIZE = 5
+
+# Stats bonus of the cards matching the color of the song
+SONG_COLOR_BONUS = 0.3
+
+def _leaderKey(card):
+    if card.photo.i_leader_skill_stat is None or not card.final_leader_skill_percentage:
+        return None
+    return (card.photo.i_color, card.photo.i_leader_skill_stat, card.final_leader_skill_percentage)
+
+def bestTeams(queryset, song_color, number=5, team_size=TEAM_SIZE):
+    """
+    Returns the number best teams of team_size collectible photos from queryset for a song of song_color,
+    as a list of dicts with score, leader and members (leader first), best first.
+
+    The power of a card is its total stats, boosted by SONG_COLOR_BONUS when it matches the song color,
+    plus the leader skill of the leader when it matches the leader color.
+    Cards sharing the same leader skill are grouped, and for a given leader only the best
+    team_size - 1 + number other cards can be part of one of the best teams, so each group
+    only looks at a handful of candidates instead of enumerating all the combinations.
+    The same cards with another leader are the same team: only the best leader is kept.
+    """
+    cards = list(queryset.select_related('photo'))
+    if len(cards) < team_size:
+        return []
+    all_stats = CollectiblePhoto.bulk_display_stats(queryset)
+    stats = np.array([all_stats[card.id][:3] for card in cards])
+    colors = np.array([card.photo.i_color for card in cards])
+    color_multiplier = np.where(colors == [name for name, _verbose_name in Photo.COLOR_CHOICES].index(song_color), 1 + SONG_COLOR_BONUS, 1.)
+    base = stats.sum(axis=1) * color_multiplier
+
+    leaders = {}
+    for i, card in enumerate(cards):
+        leaders.setdefault(_leaderKey(card), []).append(i)
+
+    best = []
+    # {frozenset of card indexes: team in best}
+    best_by_cards = {}
+    candidates_count = min(len(cards), team_size - 1 + number)
+    for key, leader_indexes in leaders.items():
+        if key is None:
+            values = base
+        else:
+            leader_color, leader_stat, leader_percentage = key
+            values = base + np.where(colors == leader_color, stats[:, leader_stat] * color_multiplier * leader_percentage / 100., 0)
+        candidates = np.argpartition(-values, candidates_count - 1)[:candidates_count]
+        candidates = sorted(candidates.tolist(), key=lambda i: -values[i])
+        leader_indexes = sorted(leader_indexes, key=lambda i: -values[i])[:number]
+        for leader in leader_indexes:
+            others = [i for i in candidates if i != leader][:team_size - 2 + number]
+            upper_bound = values[leader] + sum(values[i] for i in others[:team_size - 1])
+            if len(best) == number and upper_bound <= best[0][0]:
+                continue
+            for members in combinations(others, team_size - 1):
+                score = values[leader] + sum(values[i] for i in members)
+                team = (score, leader, members)
+                team_cards = frozenset(members + (leader,))
+                if team_cards in best_by_cards:
+                    if score <= best_by_cards[team_cards][0]:
+                        continue
+                    best.remove(best_by_cards[team_cards])
+                    heapq.heapify(best)
+                    heapq.heappush(best, team)
+                elif len(best) < number:
+                    heapq.heappush(best, team)
+                elif score > best[0][0]:
+                    del best_by_cards[frozenset(best[0][2] + (best[0][1],))]
+                    heapq.heapreplace(best, team)
+                else:
+                    continue
+                best_by_cards[team_cards] = team
+
+    return [{
+        'score': float(team_score),
+        'leader': cards[team_leader],
+        'members': [cards[team_leader]] + [cards[i] for i in team_members],
+    } for team_score, team_leader, team_members in sorted(best, reverse=True)]
@@ -1,3 +1,813 @@
-from django.test import TestCase
+# -*- coding: utf-8 -*-
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.core.urlresolvers import ResolverMatch
+from django.db import connection
+from django.http import HttpResponse, QueryDict
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test import TestCase, RequestFactory
+from django.contrib.auth.models import AnonymousUser
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone, translation
+from magi.models import User
+from magi.utils import templateVariables
+import datetime, json, os, shutil, tempfile
+from collections import OrderedDict
+from itertools import combinations
+from majilove import models, pagination, dbrouter, growthcurves, catalogexport, collectionexport, jobs, teams, simulator, images, search, fragmentcache, magicollections, facets
+from majilove import settings as majilove_settings
+from majilove.middleware import readReplicas, collectionStats
+from majilove.management.commands.rebuild_rendered_skills import rebuild_rendered_skills
+from majilove.management.commands.rebuild_idols_cache import rebuild_idols_cache
+from majilove.management.commands.import_master_data import Importer
+from majilove.management.commands.generate_settings import saveGeneratedSettings
 
-# Create your tests here.
+class MajiLoveTestCase(TestCase):
+    """
+    A user and an idol, with helpers to create their photos and accounts.
+    """
+    def setUp(self):
+        self.user = User.objects.create(username='test', email='test@example.com')
+        self.idol = models.Idol.objects.create(owner=self.user, name='Otoya', japanese_name=u'音也', small_image='idol/small/otoya.png')
+
+    def createPhoto(self, id, **fields):
+        values = {
+            'owner': self.user, 'name': u'Photo {}'.format(id), 'idol': self.idol, 'full_photo': 'photo/image/{}.png'.format(id),
+            'i_rarity': 0, 'i_color': 0,
+        }
+        values.update(fields)
+        return models.Photo.objects.create(id=id, **values)
+
+    def createAccount(self, **fields):
+        return models.Account.objects.create(owner=self.user, **dict({ 'level': 100 }, **fields))
+
+class QueryCountTestCase(MajiLoveTestCase):
+    """
+    Listing more items must not run more queries.
+    """
+    def _createPhotos(self, ids):
+        for i in ids:
+            self.createPhoto(
+                i, i_rarity=i % len(models.Photo.RARITY_CHOICES), i_color=i % len(models.Photo.COLOR_CHOICES),
+                i_skill_type=0, skill_note_count=3, i_leader_skill_stat=0, leader_skill_percentage=10,
+            )
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+            # Templates are rendered lazily
+            response.content
+        self.assertEqual(response.status_code, 200)
+        return context.captured_queries
+
+    def test_photo_list(self):
+        self._createPhotos(range(1, 4))
+        queries_count = len(self._queries('/photos/'))
+        self._createPhotos(range(4, 21))
+        self.assertEqual(len(self._queries('/photos/')), queries_count)
+
+    def test_photo_item(self):
+        self._createPhotos([1])
+        queries = self._queries('/photo/1/')
+        # The idol is selected with the photo, and displaying it doesn't write anything
+        self.assertEqual([query['sql'] for query in queries if 'FROM "majilove_idol"' in query['sql']], [])
+        self.assertEqual([query['sql'] for query in queries if query['sql'].startswith('UPDATE')], [])
+
+class KeysetPaginationTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(KeysetPaginationTestCase, self).setUp()
+        for i in range(1, 24):
+            self.createPhoto(i, release_date=datetime.date(2018, 1, 1 + i % 4) if i % 5 else None)
+
+    def test_pages_follow_ordering(self):
+        expected = list(models.Photo.objects.order_by(*pagination.ordering(pagination.PHOTOS_KEYS)).values_list('id', flat=True))
+        ids, token = [], None
+        while True:
+            items, token = pagination.keysetPage(models.Photo.objects.all(), pagination.PHOTOS_KEYS, token, page_size=5)
+            ids += [item.id for item in items]
+            if token is None:
+                break
+        self.assertEqual(ids, expected)
+
+    def test_invalid_token_starts_over(self):
+        items, _token = pagination.keysetPage(models.Photo.objects.all(), pagination.PHOTOS_KEYS, 'invalid', page_size=5)
+        self.assertEqual(len(items), 5)
+
+    def test_ordering_is_kept(self):
+        expected = list(models.Photo.objects.order_by(*pagination.ordering(pagination.PHOTOS_KEYS)).values_list('id', flat=True))
+        queryset = pagination.keysetQueryset(models.Photo.objects.all(), pagination.PHOTOS_KEYS).order_by('id')
+        self.assertEqual([photo.id for photo in queryset], expected)
+
+    def test_nulls_largest(self):
+        # PostgreSQL: NULLs come first in descending order, so only the items with a date are after a NULL
+        condition = pagination.afterFilter([('release_date', True), ('id', True)], [None, 10], nulls_largest=True)
+        self.assertEqual(
+            sorted(models.Photo.objects.filter(condition).values_list('id', flat=True)),
+            sorted(list(models.Photo.objects.filter(release_date__isnull=False).values_list('id', flat=True)) + [5]),
+        )
+
+    def test_next_page_query(self):
+        items = list(pagination.keysetQueryset(models.Photo.objects.all(), pagination.PHOTOS_KEYS)[:5])
+        context = { 'request': RequestFactory().get('/photos/?page=2&i_rarity=0'), 'items': items, 'total_results': 23 }
+        magicollections.addNextPageToken(context, pagination.PHOTOS_KEYS)
+        self.assertEqual(QueryDict(context['next_page_query']).dict(), {
+            'i_rarity': '0', pagination.TOKEN_PARAMETER: context['next_page_token'],
+        })
+        context['total_results'] = 5
+        magicollections.addNextPageToken(context, pagination.PHOTOS_KEYS)
+        self.assertIsNone(context['next_page_query'])
+
+    def test_list_view(self):
+        expected = list(models.Photo.objects.order_by(*pagination.ordering(pagination.PHOTOS_KEYS)).values_list('id', flat=True))
+        ids, query = [], ''
+        while query is not None:
+            response = self.client.get(u'/photos/?{}'.format(query))
+            self.assertEqual(response.status_code, 200)
+            ids += [photo.id for photo in response.context['items']]
+            query = response.context['next_page_query']
+            if query:
+                self.assertIn(u'href="?{}"'.format(query.replace('&', '&amp;')), response.content.decode('utf-8'))
+        self.assertEqual(ids, expected)
+
+class CollectionExportTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(CollectionExportTestCase, self).setUp()
+        self.account = self.createAccount()
+        for i in range(1, 6):
+            photo = self.createPhoto(i, i_leader_skill_stat=0, leader_skill_percentage=10)
+            models.CollectiblePhoto.objects.create(account=self.account, photo=photo, level=10)
+        self.url = '/api/collection/{}/'.format(self.account.id)
+
+    def test_export(self):
+        response = self.client.get(self.url)
+        data = json.loads(''.join(response.streaming_content))
+        self.assertEqual(len(data['photos']), 5)
+        self.assertEqual(data['photos'][0]['total_stats'], models.CollectiblePhoto.objects.get(id=data['photos'][0]['id']).total_stats)
+
+    def test_missing_values(self):
+        photo = models.Photo.objects.get(id=1)
+        photo.leader_skill_percentage = None
+        photo.i_skill_type = 0
+        photo.skill_note_count = None
+        photo.i_sub_skill_type = 0
+        photo.sub_skill_amount = None
+        photo.save()
+        photo = models.Photo.objects.get(id=2)
+        photo.i_sub_skill_type = 0
+        photo.sub_skill_amount = 2000
+        photo.save()
+        data = json.loads(''.join(collectionexport.streamCollection(self.account)))
+        photos = { item['photo']: item for item in data['photos'] }
+        self.assertEqual(len(photos), 5)
+        self.assertEqual((photos[1]['leader_skill_percentage'], photos[1]['leader_skill']), (None, None))
+        self.assertEqual((photos[1]['skill'], photos[1]['sub_skill']), (None, None))
+        # Sub skill level defaults to 1
+        self.assertIsNone(photos[2]['sub_skill_level'])
+        self.assertIn('2000', photos[2]['sub_skill'])
+        self.assertEqual(photos[2]['leader_skill_percentage'], 10)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        models.CollectiblePhoto.objects.filter(account=self.account).first().delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+class ReadReplicaRouterTestCase(TestCase):
+    def setUp(self):
+        self.router = dbrouter.ReadReplicaRouter()
+
+    def tearDown(self):
+        dbrouter.useReplicas(False)
+
+    @override_settings(READ_REPLICAS=['replica'])
+    def test_routing(self):
+        self.assertEqual(self.router.db_for_read(models.Photo), 'default')
+        dbrouter.useReplicas(True)
+        self.assertEqual(self.router.db_for_read(models.Photo), 'replica')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        # Reads what it wrote
+        self.assertEqual(self.router.db_for_write(models.CollectiblePhoto), 'default')
+        self.assertTrue(dbrouter.wrote())
+        self.assertEqual(self.router.db_for_read(models.Photo), 'default')
+
+    @override_settings(READ_REPLICAS=['replica'])
+    def test_read_your_writes(self):
+        middleware = readReplicas.ReadReplicasMiddleware()
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        self.assertEqual(self.router.db_for_read(models.Photo), 'replica')
+        self.router.db_for_write(models.CollectiblePhoto)
+        response = middleware.process_response(request, HttpResponse())
+        request.COOKIES[readReplicas.COOKIE_NAME] = response.cookies[readReplicas.COOKIE_NAME].value
+        middleware.process_request(request)
+        self.assertEqual(self.router.db_for_read(models.Photo), 'default')
+
+class GrowthCurvesTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(GrowthCurvesTestCase, self).setUp()
+        self.photos = [self.createPhoto(
+            i, i_rarity=i % len(models.Photo.RARITY_CHOICES),
+            dance_min=100 * i, dance_single_copy_max=1000 * i, dance_max_copy_max=1300 * i,
+            vocal_min=90 * i, vocal_single_copy_max=950 * i, vocal_max_copy_max=1200 * i,
+            charm_min=80 * i, charm_single_copy_max=900 * i, charm_max_copy_max=1100 * i,
+        ) for i in range(1, 5)]
+
+    def test_curves_match_level_stats(self):
+        result = growthcurves.compare([photo.id for photo in self.photos])
+        self.assertEqual([photo['id'] for photo in result['photos']], [photo.id for photo in self.photos])
+        for photo, curves in zip(self.photos, result['photos']):
+            self.assertEqual(len(curves['curves']['dance']), photo.max_max_level)
+            for level in range(1, photo.max_max_level + 1):
+                for stat in models.Photo.STATISTICS.keys():
+                    self.assertEqual(curves['curves'][stat][level - 1], photo.compute_level_stat(stat, level))
+
+class CatalogExportTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(CatalogExportTestCase, self).setUp()
+        for i in range(1, 5):
+            self.createPhoto(i, release_date=datetime.date(2018, i % 2 + 1, 1))
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_only_changed_shards_are_generated(self):
+        # idols, photos and skills of 2 months
+        self.assertEqual(catalogexport.exportCatalog(self.directory, languages=['en']), (5, 0))
+        self.assertEqual(catalogexport.exportCatalog(self.directory, languages=['en']), (0, 5))
+        photo = models.Photo.objects.get(id=1)
+        photo.name = u'New name'
+        photo.save()
+        self.assertEqual(catalogexport.exportCatalog(self.directory, languages=['en']), (2, 3))
+        shard = catalogexport.loadManifest(self.directory)['languages']['en']['photos/2018-02']
+        with open(os.path.join(self.directory, shard['file'])) as f:
+            self.assertEqual(json.load(f)[0]['name'], u'New name')
+
+class LazySettingsTestCase(TestCase):
+    def setUp(self):
+        self.calls = []
+        majilove_settings.LAZY_SETTINGS['TEST_SETTING'] = lambda: self.calls.append(1) or len(self.calls)
+
+    def tearDown(self):
+        del majilove_settings.LAZY_SETTINGS['TEST_SETTING']
+        majilove_settings.__dict__.pop('TEST_SETTING', None)
+
+    def test_computed_on_first_access(self):
+        self.assertNotIn('TEST_SETTING', vars(majilove_settings))
+        self.assertEqual(self.calls, [])
+        self.assertEqual(majilove_settings.TEST_SETTING, 1)
+        self.assertEqual(majilove_settings.TEST_SETTING, 1)
+        self.assertEqual(self.calls, [1])
+        self.assertIs(majilove_settings.ACCOUNT_MODEL, models.Account)
+        self.assertRaises(AttributeError, getattr, majilove_settings, 'UNKNOWN_SETTING')
+
+class GeneratedSettingsTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, 'majilove_project'))
+        self.path = os.path.join(self.directory, 'majilove_project', 'generated_settings.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _content(self):
+        with open(self.path) as f:
+            return f.read()
+
+    def test_unchanged_is_not_saved(self):
+        with self.settings(BASE_DIR=self.directory, SITE='majilove'):
+            self.assertTrue(saveGeneratedSettings({ 'TOTAL_DONATORS': 1 }))
+            content = self._content()
+            self.assertFalse(saveGeneratedSettings({ 'TOTAL_DONATORS': 1 }))
+            self.assertEqual(self._content(), content)
+            self.assertTrue(saveGeneratedSettings({ 'TOTAL_DONATORS': 2 }))
+            self.assertEqual(json.loads(self._content())['settings'], { 'TOTAL_DONATORS': 2 })
+
+    def test_no_partial_file_after_failure(self):
+        def failingRename(source, destination):
+            raise OSError('Failing on purpose')
+        with self.settings(BASE_DIR=self.directory, SITE='majilove'):
+            saveGeneratedSettings({ 'TOTAL_DONATORS': 1 })
+            content = self._content()
+            rename, os.rename = os.rename, failingRename
+            try:
+                self.assertRaises(OSError, saveGeneratedSettings, { 'TOTAL_DONATORS': 2 })
+            finally:
+                os.rename = rename
+            self.assertEqual(os.listdir(os.path.dirname(self.path)), ['generated_settings.json'])
+            self.assertEqual(self._content(), content)
+
+@jobs.task(max_attempts=2)
+def failing_test_job():
+    raise ValueError('Failing on purpose')
+
+class JobsTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(JobsTestCase, self).setUp()
+        self.account = self.createAccount()
+        models.Job.objects.all().delete()
+
+    def test_deduplication(self):
+        first = jobs.enqueue('update_account_collection_summary', key='summary', account_id=self.account.id)
+        second = jobs.enqueue('update_account_collection_summary', key='summary', priority=20, account_id=self.account.id)
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(models.Job.objects.get().priority, 20)
+        self.assertEqual(jobs.runPending(), 1)
+        self.assertTrue(models.AccountCollectionSummary.objects.filter(account=self.account).exists())
+        self.assertFalse(models.Job.objects.exists())
+
+    def test_retries(self):
+        jobs.enqueue('failing_test_job')
+        self.assertEqual(jobs.runPending(), 1)
+        job = models.Job.objects.get()
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertIn('Failing on purpose', job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIsNone(jobs.claim('test'))
+        # Fails for good after max_attempts
+        models.Job.objects.update(run_after=timezone.now())
+        self.assertEqual(jobs.runPending(), 1)
+        self.assertEqual(models.Job.objects.get().status, 'failed')
+
+class LeaderboardTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(LeaderboardTestCase, self).setUp()
+        self.accounts = [self.createAccount(level=level) for level in [10, 20, 30]]
+        jobs.runPending()
+
+    def _ranks(self):
+        return list(models.Account.objects.order_by('id').values_list('_cache_leaderboard', flat=True))
+
+    def _setLevel(self, account, level):
+        account.level = level
+        account.save()
+
+    def test_level_up(self):
+        self.assertEqual(self._ranks(), [3, 2, 1])
+        self._setLevel(self.accounts[0], 40)
+        self.assertEqual(jobs.runPending(), 1)
+        self.assertEqual(self._ranks(), [1, 3, 2])
+
+    def test_level_down(self):
+        self._setLevel(self.accounts[2], 5)
+        self.assertEqual(jobs.runPending(), 1)
+        self.assertEqual(self._ranks(), [2, 1, 3])
+
+    def test_ties(self):
+        self._setLevel(self.accounts[0], 30)
+        jobs.runPending()
+        self.assertEqual(self._ranks(), [1, 3, 1])
+        self._setLevel(self.accounts[1], None)
+        jobs.runPending()
+        self.assertEqual(self._ranks(), [1, None, 1])
+
+    def test_delete(self):
+        self.accounts[2].delete()
+        self.assertEqual(jobs.runPending(), 1)
+        self.assertEqual(self._ranks(), [2, 1])
+
+    def test_serialized(self):
+        # Level changes share one job, which doesn't run while another one is running
+        self._setLevel(self.accounts[0], 40)
+        self._setLevel(self.accounts[1], 50)
+        self.assertEqual(models.Job.objects.filter(name='update_account_ranks').count(), 1)
+        models.Job.objects.update(i_status=jobs.RUNNING)
+        self._setLevel(self.accounts[2], 60)
+        self.assertIsNone(jobs.claim('test'))
+        models.Job.objects.filter(i_status=jobs.RUNNING).delete()
+        self.assertEqual(jobs.runPending(), 1)
+        self.assertEqual(self._ranks(), [3, 2, 1])
+
+class DisplayStatsTestCase(MajiLoveTestCase):
+    """
+    The vectorized stats must be the same as the properties of each collectible photo.
+    """
+    def setUp(self):
+        super(DisplayStatsTestCase, self).setUp()
+        self.account = self.createAccount()
+        for i, rarity in enumerate(models.Photo.RARITIES.keys()):
+            photo = self.createPhoto(
+                i + 1, i_rarity=i,
+                dance_min=101, dance_single_copy_max=1003, dance_max_copy_max=1307,
+                vocal_min=97, vocal_single_copy_max=951, vocal_max_copy_max=1211,
+                charm_min=83, charm_single_copy_max=899, charm_max_copy_max=1103,
+            )
+            for level in set([1, photo.single_max_level, photo.max_max_level]):
+                models.CollectiblePhoto.objects.create(
+                    account=self.account, photo=photo, level=level, moments_unlocked=100 if level > 1 else 0,
+                    bonus_moment_squares_unlocked=7 if rarity == 'UR' else 0,
+                    i_silver_crown_amount=1, i_silver_crown_attribute=level % 3,
+                )
+
+    def test_bulk_display_stats(self):
+        stats = models.CollectiblePhoto.display_stats_for_account(self.account)
+        collectible_photos = models.CollectiblePhoto.objects.filter(account=self.account).select_related('photo')
+        self.assertEqual(len(stats), collectible_photos.count())
+        for collectible_photo in collectible_photos:
+            self.assertEqual(stats[collectible_photo.id], (
+                collectible_photo.display_dance, collectible_photo.display_vocal,
+                collectible_photo.display_charm, collectible_photo.total_stats,
+            ))
+
+    def test_update_cache_stats_for_queryset(self):
+        queryset = models.CollectiblePhoto.objects.filter(account=self.account)
+        queryset.update(_cache_stats_dance=None, _cache_stats_vocal=None, _cache_stats_charm=None, _cache_stats_total=None)
+        self.assertEqual(models.CollectiblePhoto.update_cache_stats_for_queryset(queryset, chunk_size=3), queryset.count())
+        for collectible_photo in queryset.select_related('photo'):
+            self.assertEqual((
+                collectible_photo._cache_stats_dance, collectible_photo._cache_stats_vocal,
+                collectible_photo._cache_stats_charm, collectible_photo._cache_stats_total,
+            ), (
+                collectible_photo.display_dance, collectible_photo.display_vocal,
+                collectible_photo.display_charm, collectible_photo.total_stats,
+            ))
+            self.assertIsNotNone(collectible_photo._cache_stats_last_update)
+
+class RenderedSkillsTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(RenderedSkillsTestCase, self).setUp()
+        self.createPhoto(1, i_leader_skill_stat=0, leader_skill_percentage=10)
+        models.Photo.objects.filter(id=1).update(_cache_rendered_skills=None)
+
+    def test_read_does_not_write(self):
+        photo = models.Photo.objects.get(id=1)
+        with self.assertNumQueries(0):
+            self.assertEqual(photo.get_rendered_skill('leader_skill', language='en'), unicode(photo.compute_leader_skill()))
+        self.assertIsNone(models.Photo.objects.get(id=1)._cache_rendered_skills)
+
+    def test_rebuild_fills_all_languages(self):
+        rebuild_rendered_skills()
+        photo = models.Photo.objects.get(id=1)
+        self.assertEqual(sorted(photo.rendered_skills.keys()), sorted(language for language, _verbose_name in django_settings.LANGUAGES))
+
+    def test_missing_values(self):
+        photo = self.createPhoto(2, i_skill_type=models.Photo.SKILL_TYPES.keys().index('cutin'), skill_percentage=None)
+        for language, _verbose_name in django_settings.LANGUAGES:
+            self.assertIsNone(photo.get_rendered_skill('skill', language=language))
+            self.assertIsNone(photo.get_rendered_skill('japanese_skill', language=language))
+        photo.skill_percentage = 15
+        photo.save()
+        self.assertIn(u'15', models.Photo.objects.get(id=2).get_rendered_skill('skill', language='en'))
+
+class _TemplateValues(object):
+    def __getattr__(self, name):
+        return u'<{}>'.format(name)
+
+class CompiledTemplatesTestCase(TestCase):
+    def test_same_as_template_variables(self):
+        """
+        Compiled templates render the same as formatting the template with the values of its templateVariables.
+        """
+        templates = [
+            (info[key], u'')
+            for infos in [models.Photo.SKILL_TYPES.values(), models.Photo.SUB_SKILL_TYPES.values(), [models.Photo.LEADER_SKILL_INFO]]
+            for info in infos
+            for key in ['compiled_template', 'compiled_japanese_template']
+        ] + [(models.CollectiblePhoto.CROWN_COMPILED_TEMPLATE, prefix) for prefix in [u'silver_', u'gold_', u'rainbow_']]
+        item = _TemplateValues()
+        for language in ['en', 'ja', 'fr']:
+            with translation.override(language):
+                for compiled_template, prefix in templates:
+                    template = unicode(compiled_template.template)
+                    self.assertEqual(
+                        compiled_template.format(item, prefix=prefix),
+                        template.format(**{ k: getattr(item, prefix + k) for k in templateVariables(template) }),
+                    )
+
+class IdolsCacheTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(IdolsCacheTestCase, self).setUp()
+        for i in range(1, 3):
+            self.createPhoto(i)
+        models.Job.objects.all().delete()
+
+    def _cachedNames(self):
+        return [json.loads(photo._cache_j_idol)['names']['en'] for photo in models.Photo.objects.order_by('id')]
+
+    def test_idol_save_refreshes_photos(self):
+        version = models.Photo.objects.get(id=1)._cache_version
+        self.idol.name = 'Otoya Ittoki'
+        self.idol.save()
+        self.assertEqual(jobs.runPending(), 1)
+        self.assertEqual(self._cachedNames(), ['Otoya Ittoki', 'Otoya Ittoki'])
+        self.assertEqual(models.Photo.objects.get(id=1)._cache_version, version + 1)
+
+    def test_rebuild(self):
+        models.Idol.objects.filter(id=self.idol.id).update(name='Otoya Ittoki')
+        models.Photo.objects.update(_cache_j_idol=None)
+        rebuild_idols_cache(chunk_size=1)
+        self.assertEqual(self._cachedNames(), ['Otoya Ittoki', 'Otoya Ittoki'])
+
+class TeamsTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(TeamsTestCase, self).setUp()
+        self.account = self.createAccount()
+        for i in range(1, 7):
+            photo = self.createPhoto(
+                i, i_color=i % 2, i_leader_skill_stat=i % 3,
+                # No leader skill percentage on the last photo
+                leader_skill_percentage=10 * i if i < 6 else None,
+                dance_min=100 * i, dance_single_copy_max=200 * i, vocal_min=90 * i, vocal_single_copy_max=190 * i,
+                charm_min=80 * i, charm_single_copy_max=180 * i,
+            )
+            # Same cards twice: the same team with either of them as leader
+            for _copy in range(2 if i in [4, 5] else 1):
+                models.CollectiblePhoto.objects.create(account=self.account, photo=photo, level=photo.single_max_level)
+
+    def _bruteForceBestScore(self, song_color):
+        cards = list(models.CollectiblePhoto.objects.filter(account=self.account).select_related('photo'))
+        song_color = [name for name, _verbose_name in models.Photo.COLOR_CHOICES].index(song_color)
+        def power(card, leader):
+            multiplier = 1 + teams.SONG_COLOR_BONUS if card.photo.i_color == song_color else 1.
+            value = card.total_stats * multiplier
+            key = teams._leaderKey(leader)
+            if key is not None and card.photo.i_color == key[0]:
+                value += getattr(card, u'display_{}'.format(models.Photo.STATISTICS.keys()[key[1]])) * multiplier * key[2] / 100.
+            return value
+        return max(
+            sum(power(card, leader) for card in members)
+            for members in combinations(cards, teams.TEAM_SIZE) for leader in members
+        )
+
+    def test_best_teams(self):
+        for song_color in ['star', 'shine']:
+            result = teams.bestTeams(models.CollectiblePhoto.objects.filter(account=self.account), song_color, number=3)
+            self.assertEqual(len(result), 3)
+            self.assertAlmostEqual(result[0]['score'], self._bruteForceBestScore(song_color))
+            self.assertEqual(len(set(frozenset(card.id for card in team['members']) for team in result)), 3)
+
+    def test_no_leader_skill_percentage(self):
+        collectible_photo = models.CollectiblePhoto.objects.get(photo_id=6)
+        self.assertIsNone(collectible_photo.final_leader_skill_percentage)
+        self.assertIsNone(teams._leaderKey(collectible_photo))
+
+class SimulatorTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(SimulatorTestCase, self).setUp()
+        account = self.createAccount()
+        for i in range(1, 6):
+            photo = self.createPhoto(
+                i, dance_min=1000, vocal_min=1000, charm_min=1000,
+                i_skill_type=i % len(models.Photo.SKILL_TYPE_CHOICES), skill_note_count=3, skill_percentage=10,
+                i_sub_skill_type=i % len(models.Photo.SUB_SKILL_TYPE_CHOICES), sub_skill_amount=2000, sub_skill_percentage=80,
+                sub_skill_increment=1000,
+            )
+            # No sub skill level: level 1
+            models.CollectiblePhoto.objects.create(account=account, photo=photo, sub_skill_level=None)
+        self.cards = list(models.CollectiblePhoto.objects.filter(account=account).select_related('photo'))
+
+    def test_team_spec(self):
+        spec = simulator.teamSpec(self.cards)
+        self.assertEqual(spec['power'], sum(card.total_stats for card in self.cards))
+        self.assertEqual(len(spec['skills']), 5)
+        self.assertEqual([amount for _type, amount, _percentage in spec['sub_skills']], [2000] * 5)
+
+    def test_simulate(self):
+        result = simulator.simulate(self.cards, runs=1000, seed=1)
+        self.assertEqual(result, simulator.simulate(self.cards, runs=1000, seed=1))
+        self.assertTrue(result['min'] <= result['percentiles'][5] <= result['percentiles'][95] <= result['max'])
+        # Without a bad note, the live can't fail
+        self.assertGreater(simulator.simulate(self.cards, accuracy=[1, 0, 0, 0], runs=100)['min'], 0)
+
+class CollectionStatsTestCase(TestCase):
+    def setUp(self):
+        collectionStats._stats.clear()
+
+    def test_record(self):
+        middleware = collectionStats.CollectionStatsMiddleware()
+        request = RequestFactory().get('/photos/')
+        request.resolver_match = ResolverMatch(lambda request: None, [], {}, url_name='photo_list')
+        middleware.process_request(request)
+        self.assertNotEqual(Template.render, collectionStats._originalTemplateRender)
+        User.objects.count()
+        User.objects.count()
+        Template('{{ value }}').render(Context({ 'value': 1 }))
+        middleware.process_response(request, HttpResponse())
+        # Template.render is only replaced during the request
+        self.assertEqual(Template.render, collectionStats._originalTemplateRender)
+        sample = collectionStats.samples()['photo_list'][0]
+        self.assertEqual((sample['queries'], sample['duplicated_queries']), (2, 1))
+        self.assertGreater(sample['template_time'], 0)
+
+class ImageDerivativesTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(ImageDerivativesTestCase, self).setUp()
+        models.Job.objects.all().delete()
+        self.photo = self.createPhoto(1)
+
+    def _enqueuedFieldNames(self):
+        return [json.loads(job.arguments)['field_names'] for job in models.Job.objects.filter(name='generate_photo_image_derivatives')]
+
+    def test_only_changed_images(self):
+        self.assertEqual(self._enqueuedFieldNames(), [['full_photo']])
+        models.Job.objects.all().delete()
+        self.photo.name = u'New name'
+        self.photo.save()
+        self.assertEqual(self._enqueuedFieldNames(), [])
+        self.photo.art = 'photo/art/1.png'
+        self.photo.save()
+        self.assertEqual(self._enqueuedFieldNames(), [['art']])
+
+    def test_keeps_other_images(self):
+        full_photo = { '200': 'derivatives/ab/abc_200.jpg' }
+        models.Photo.objects.filter(id=1).update(_cache_image_derivatives=json.dumps({
+            'full_photo': full_photo, 'art': { '200': 'derivatives/cd/cde_200.jpg' },
+        }))
+        # The art has been removed
+        self.assertEqual(images.generatePhotoDerivatives(1, field_names=['art']), { 'full_photo': full_photo })
+        self.assertEqual(models.Photo.objects.get(id=1).image_derivatives, { 'full_photo': full_photo })
+
+class ImportMasterDataTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(ImportMasterDataTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _import(self, rows):
+        path = os.path.join(self.directory, 'master.jsonl')
+        with open(path, 'w') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+        importer = Importer(self.user)
+        importer.importFile(path)
+        return importer.errors
+
+    def _ngrams(self, collection, item_id):
+        return set(models.SearchNgram.objects.filter(collection=collection, item_id=item_id).values_list('ngram', flat=True))
+
+    def test_index_and_versions(self):
+        self.assertEqual(self._import([
+            { 'type': 'idol', 'name': 'Ren', 'japanese_name': u'レン' },
+            { 'type': 'photo', 'id': 1, 'name': 'Shining', 'idol': 'Ren', 'rarity': 'N', 'color': 'star' },
+        ]), [])
+        idol = models.Idol.objects.get(name='Ren')
+        self.assertIn(u'レン', self._ngrams('idol', idol.id))
+        self.assertIn('sh', self._ngrams('photo', 1))
+        version = models.Photo.objects.get(id=1)._cache_version
+        facets_version = facets.version()
+        self.assertTrue(models.Job.objects.filter(name='update_collection_completions').exists())
+
+        self.assertEqual(self._import([
+            { 'type': 'idol', 'name': 'Ren', 'japanese_name': u'レン', 'd_names': { 'zh-hant': u'神宮寺' } },
+            { 'type': 'photo', 'id': 1, 'name': 'Dream' },
+        ]), [])
+        # The idol's translated name is indexed with its photos
+        self.assertIn(u'神宮', self._ngrams('photo', 1))
+        self.assertIn('dr', self._ngrams('photo', 1))
+        self.assertNotIn('sh', self._ngrams('photo', 1))
+        # Once for the idol, once for the photo
+        self.assertEqual(models.Photo.objects.get(id=1)._cache_version, version + 2)
+        self.assertNotEqual(facets.version(), facets_version)
+
+    def test_cache_error_only_skips_its_row(self):
+        update_caches = models.Photo.update_caches
+        def failingUpdateCaches(photo):
+            if photo.id == 2:
+                raise ValueError('Failing on purpose')
+            update_caches(photo)
+        models.Photo.update_caches = failingUpdateCaches
+        try:
+            errors = self._import([
+                { 'type': 'photo', 'id': 1, 'name': 'Shining', 'idol': 'Otoya', 'rarity': 'N', 'color': 'star' },
+                { 'type': 'photo', 'id': 2, 'name': 'Dream', 'idol': 'Otoya', 'rarity': 'N', 'color': 'star' },
+                { 'type': 'photo', 'id': 3, 'name': 'Star', 'idol': 'Otoya', 'rarity': 'N', 'color': 'star' },
+            ])
+        finally:
+            models.Photo.update_caches = update_caches
+        self.assertEqual(errors, [(2, 'Failing on purpose')])
+        self.assertEqual(sorted(models.Photo.objects.values_list('id', flat=True)), [1, 3])
+
+class SearchTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(SearchTestCase, self).setUp()
+        # The names match better than the translation
+        for i, name, names in [(1, 'Dream', None), (2, 'Star', { 'fr': 'Dream' }), (3, 'Dream', None), (4, 'Shine', None)]:
+            self.createPhoto(i, name=name, d_names=json.dumps(names) if names else None)
+        search.rebuildIndex('photo')
+
+    def test_search(self):
+        self.assertEqual(search.search('photo', 'dream'), [1, 3, 2])
+        self.assertEqual(search.search('photo', u'音也'), [1, 2, 3, 4])
+        self.assertEqual(search.search('photo', 'nothing'), [])
+
+    def test_ordering_is_kept(self):
+        queryset = search.searchQueryset(models.Photo.objects.all(), 'photo', 'dream').order_by('-id')
+        self.assertEqual([photo.id for photo in queryset], [1, 3, 2])
+        queryset = search.searchQueryset(models.Photo.objects.all(), 'photo', 'dream', ranked=False).order_by('-id')
+        self.assertEqual([photo.id for photo in queryset], [3, 2, 1])
+
+    def test_list_view(self):
+        response = self.client.get('/photos/?search=dream')
+        self.assertEqual([photo.id for photo in response.context['items']], [1, 3, 2])
+        response = self.client.get('/photos/?search=dream&ordering=id')
+        self.assertEqual(sorted(photo.id for photo in response.context['items']), [1, 2, 3])
+
+class FragmentCacheTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(FragmentCacheTestCase, self).setUp()
+        self.photo = models.Photo(id=1, _cache_version=3)
+
+    def _request(self, user):
+        request = RequestFactory().get('/photo/1/')
+        request.user = user
+        return request
+
+    def test_only_anonymous_requests(self):
+        self.assertIsNone(fragmentcache.photoFieldsKey('ItemView', self.photo, 'en', {}))
+        self.assertIsNone(fragmentcache.photoFieldsKey('ItemView', self.photo, 'en', { 'request': self._request(self.user) }))
+        self.photo.request = self._request(self.user)
+        self.assertIsNone(fragmentcache.photoFieldsKey('ItemView', self.photo, 'en', {}))
+        self.photo.request = self._request(AnonymousUser())
+        key = fragmentcache.photoFieldsKey('ItemView', self.photo, 'en', {})
+        self.assertEqual(key, fragmentcache.photoFieldsKey('ItemView', self.photo, 'en', { 'request': self._request(AnonymousUser()) }))
+        self.photo._cache_version = 4
+        self.assertNotEqual(key, fragmentcache.photoFieldsKey('ItemView', self.photo, 'en', {}))
+
+    def test_cache(self):
+        cache = fragmentcache.FragmentCache(fragmentcache.MemoryBackend(max_entries=1))
+        fields = lambda: OrderedDict([('name', { 'value': 'Photo' })])
+        cache.get_or_set('a', fields)
+        cached = cache.get_or_set('a', lambda: self.fail('Not cached'))
+        # Changing the fields doesn't change the cache
+        cached['name']['value'] = 'Changed'
+        self.assertEqual(cache.get_or_set('a', fields)['name']['value'], 'Photo')
+        cache.get_or_set('b', fields)
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (2, 2))
+
+class CollectionSummaryTestCase(MajiLoveTestCase):
+    def setUp(self):
+        super(CollectionSummaryTestCase, self).setUp()
+        self.account = self.createAccount()
+        self.photo = self.createPhoto(
+            1, dance_min=100, dance_single_copy_max=1000, vocal_min=100, vocal_single_copy_max=1000, charm_min=100, charm_single_copy_max=1000,
+        )
+        self.collectible_photo = models.CollectiblePhoto.objects.create(account=self.account, photo=self.photo, level=1)
+        jobs.runPending()
+
+    def test_refreshed_after_stats_update(self):
+        self.assertEqual(models.AccountCollectionSummary.objects.get(account=self.account).team_power, 300)
+        # The stats job enqueues the summary job
+        self.photo.dance_min = 200
+        self.photo.save()
+        jobs.runPending()
+        self.assertEqual(models.AccountCollectionSummary.objects.get(account=self.account).team_power, 400)
+
+    def test_fields(self):
+        fields = dict(magicollections.collectionSummaryFields(models.Account.objects.get(id=self.account.id)))
+        self.assertEqual(fields['collection']['value'], u'1 (100%)')
+        self.assertEqual(fields['team_power']['value'], 300)
+        models.AccountCollectionSummary.objects.all().delete()
+        self.assertEqual(magicollections.collectionSummaryFields(models.Account.objects.get(id=self.account.id)), [])
+
+class FacetsTestCase(MajiLoveTestCase):
+    def setUp(self):
+        # Test databases start again from the same versions
+        cache.clear()
+        super(FacetsTestCase, self).setUp()
+        for i in range(1, 4):
+            self.createPhoto(i, i_rarity=i % 2)
+
+    def test_facets(self):
+        result = facets.photoFacets({ 'i_rarity': '1' })
+        self.assertEqual(result['total'], 2)
+        # Counts of the other rarities don't apply the rarity filter
+        self.assertEqual(result['i_rarity'], { 0: 1, 1: 2 })
+        self.assertEqual(result['i_color'], { 0: 2 })
+
+    def test_invalidation(self):
+        self.assertEqual(facets.photoFacets({})['i_rarity'], { 0: 1, 1: 2 })
+        photo = models.Photo.objects.get(id=1)
+        photo.i_rarity = 0
+        photo.save()
+        self.assertEqual(facets.photoFacets({})['i_rarity'], { 0: 2, 1: 1 })
+        self.createPhoto(4)
+        self.assertEqual(facets.photoFacets({})['i_rarity'], { 0: 3, 1: 1 })
+        models.Photo.objects.filter(id=3).delete()
+        self.assertEqual(facets.photoFacets({})['i_rarity'], { 0: 3 })
+        # Bulk updates don't send signals, they invalidate the facets themselves
+        models.Photo.objects.filter(id=4).update(i_rarity=1)
+        self.assertEqual(facets.photoFacets({})['i_rarity'], { 0: 3 })
+        facets.invalidate()
+        self.assertEqual(facets.photoFacets({})['i_rarity'], { 0: 2, 1: 1 })
+
+    def test_lost_version(self):
+        self.assertEqual(facets.photoFacets({})['i_rarity'], { 0: 1, 1: 2 })
+        models.Photo.objects.filter(id=1).update(i_rarity=0)
+        cache.delete(facets.VERSION_KEY)
+        self.assertEqual(facets.photoFacets({})['i_rarity'], { 0: 2, 1: 1 })
+
+    def test_links(self):
+        links = dict(magicollections.photoFacetsLinks(RequestFactory().get('/photos/?i_rarity=1&page=2')))
+        rarities = links[models.Photo._meta.get_field('i_rarity').verbose_name]
+        self.assertEqual([(count, QueryDict(query).dict(), selected) for _option, count, query, selected in rarities], [
+            (1, { 'i_rarity': '0' }, False),
+            (2, { 'i_rarity': '1' }, True),
+        ])
+        self.assertEqual([(option, count) for option, count, _query, _selected in links[models.Photo._meta.get_field('idol').verbose_name]], [
+            ('Otoya', 2),
+        ])
+        content = render_to_string('include/photosFacets.html', { 'facets': links.items() })
+        self.assertIn(u'href="?{}"'.format(rarities[0][2]), content)
@@ -1,3 +1,64 @@
-from django.shortcuts import render
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_GET
+from majilove import models
+from majilove.teams import bestTeams
+from majilove.middleware import collectionStats
+from majilove.fragmentcache import photo_fields_cache
+from majilove.growthcurves import compare, MAX_PHOTOS
+from majilove.collectionexport import streamCollection, collectionETag, collectionLastModified
 
-# Create your views here.
+def teams(request, account):
+    account = get_object_or_404(models.Account, pk=account)
+    color = request.GET.get('color', models.Photo.COLOR_CHOICES[0][0])
+    if color not in dict(models.Photo.COLOR_CHOICES):
+        raise Http404
+    try:
+        number = min(max(int(request.GET.get('number', 5)), 1), 20)
+    except ValueError:
+        raise Http404
+    return JsonResponse({
+        'account': account.id,
+        'color': color,
+        'teams': [{
+            'score': team['score'],
+            'leader': team['leader'].id,
+            'members': [{
+                'id': card.id,
+                'photo': card.photo_id,
+                'name': unicode(card.photo),
+            } for card in team['members']],
+        } for team in bestTeams(account.photoscollectors.all(), color, number=number)],
+    })
+
+@require_GET
+@condition(
+    etag_func=lambda request, account: collectionETag(account),
+    last_modified_func=lambda request, account: collectionLastModified(account),
+)
+def collection_export(request, account):
+    account = get_object_or_404(models.Account, pk=account)
+    response = StreamingHttpResponse(streamCollection(account), content_type='application/json')
+    response['Vary'] = 'Accept-Language, Cookie'
+    return response
+
+def photo_curves(request):
+    try:
+        photo_ids = [int(photo_id) for photo_id in request.GET.get('ids', '').split(',') if photo_id]
+    except ValueError:
+        raise Http404
+    if not photo_ids or len(photo_ids) > MAX_PHOTOS:
+        raise Http404
+    return JsonResponse(compare(photo_ids))
+
+def collection_stats(request):
+    if not request.user.is_authenticated() or not request.user.is_staff:
+        raise Http404
+    source = request.GET.get('source', 'process')
+    return JsonResponse({
+        'source': source,
+        'query_budget': collectionStats.QUERY_BUDGET,
+        'photo_fields_cache': photo_fields_cache.stats(),
+        'views': collectionStats.summarize(
+            collectionStats.loadDumps() if source == 'all' else collectionStats.samples()),
+    })
@@ -9,7 +9,7 @@ https://docs.djangoproject.com/en/1.7/ref/settings/
 """
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
-import os
+import os, json, datetime
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 
 
@@ -45,6 +45,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'majilove.middleware.readReplicas.ReadReplicasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -57,8 +58,11 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.common.CommonMiddleware',
     'magi.middleware.languageFromPreferences.LanguageFromPreferenceMiddleWare',
     'magi.middleware.httpredirect.HttpRedirectMiddleware',
+    'majilove.middleware.collectionStats.CollectionStatsMiddleware',
 )
 
+COLLECTION_STATS_QUERY_BUDGET = 50
+
 ROOT_URLCONF = 'majilove_project.urls'
 
 WSGI_APPLICATION = 'majilove_project.wsgi.application'
@@ -71,9 +75,26 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Reads of the catalog and collection pages go to the replicas, see majilove.dbrouter
+# Add them in local_settings, or set MAJILOVE_SQLITE_REPLICA to try it locally with a copy of db.sqlite3
+if os.environ.get('MAJILOVE_SQLITE_REPLICA'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['MAJILOVE_SQLITE_REPLICA'],
+        'CONN_MAX_AGE': 60,
+        'TEST': { 'MIRROR': 'default' },
+    }
+
+DATABASE_ROUTERS = ['majilove.dbrouter.ReadReplicaRouter']
+
+# Aliases of the replicas, all the databases but default when None
+READ_REPLICAS = None
+READ_YOUR_WRITES_SECONDS = 10
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.7/topics/i18n/
 
@@ -135,8 +156,11 @@ MIN_WIDTH = 300
 MIN_HEIGHT = 300
 
 try:
-    from generated_settings import *
-except ImportError, e:
+    with open(os.path.join(BASE_DIR, 'majilove_project', 'generated_settings.json')) as f:
+        _generated_settings = json.load(f)
+    globals().update(_generated_settings['settings'])
+    GENERATED_DATE = datetime.datetime.fromtimestamp(_generated_settings['generated_date'])
+except (IOError, ValueError, KeyError), e:
     pass
 try:
     from local_settings import *
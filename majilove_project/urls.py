@@ -6,6 +6,10 @@ urlpatterns = patterns('',
     # url(r'^$', 'majilove_project.views.home', name='home'),
     # url(r'^blog/', include('blog.urls')),
 
+    url(r'^teams/(?P<account>\d+)/$', 'majilove.views.teams', name='teams'),
+    url(r'^api/collection/(?P<account>\d+)/$', 'majilove.views.collection_export', name='collection_export'),
+    url(r'^api/photos/curves/$', 'majilove.views.photo_curves', name='photo_curves'),
+    url(r'^staff/collection_stats/$', 'majilove.views.collection_stats', name='collection_stats'),
     url(r'^', include('magi.urls')),
     url(r'^admin/', include(admin.site.urls)),
 )